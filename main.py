@@ -1,20 +1,41 @@
 # main.py - Complete version with authentication system
 import os
 import shutil
+import subprocess
+import sys
 import uuid
 import threading
 import time
 import random
+import signal
+import re
 import logging
+import mimetypes
+import multiprocessing
+import queue
+import atexit
+import bisect
+import copy
+import itertools
+import base64
+import http.client
+import secrets
+import contextlib
+import json
+import zipfile
 from datetime import datetime, timedelta
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode, quote
+from collections import OrderedDict, deque
 from functools import wraps
+from types import MappingProxyType
 import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask import Flask, request, render_template, send_file, jsonify, session, redirect, url_for, flash, g
-from flask_socketio import SocketIO
+from flask import Flask, Response, request, render_template, send_file, jsonify, session, redirect, url_for, flash, g
+from flask_socketio import SocketIO, join_room, emit
+from socketio import PubSubManager
 from werkzeug.utils import secure_filename
 import yt_dlp
+from yt_dlp.cookies import YoutubeDLCookieJar
 
 # --- Logging ---
 logging.basicConfig(
@@ -23,6 +44,8 @@ logging.basicConfig(
     handlers=[logging.FileHandler('downloader.log'), logging.StreamHandler()]
 )
 log = logging.getLogger("yt-any")
+# Download worker processes import this module too; they skip start-up work and one-time messages
+IN_DOWNLOAD_WORKER = multiprocessing.parent_process() is not None
 
 # --- Paths ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -37,53 +60,488 @@ os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 os.makedirs(COOKIES_DIR, exist_ok=True)
 os.makedirs(STATIC_DIR, exist_ok=True)
 
+# --- Serving ---
+# `python main.py` with SERVE_WORKERS > 1 starts that many serving processes on consecutive ports
+# from SERVE_PORT; a proxy with sticky sessions (nginx ip_hash) spreads clients over them
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', '1'))
+SERVE_HOST = os.environ.get('SERVE_HOST', '127.0.0.1')
+SERVE_PORT = int(os.environ.get('SERVE_PORT', '5000'))
+WORKER_NAME = os.environ.get('WORKER_NAME', 'main')  # owner recorded on the jobs this process runs
+CLUSTER_MODE = SERVE_WORKERS > 1
+# In multi-worker mode every job runs in this worker, so queue caps, bandwidth shares, request
+# merging and playlists stay global; the other workers forward job requests to it
+CLUSTER_DISPATCHER = "worker-0"
+IS_DISPATCHER = not CLUSTER_MODE or WORKER_NAME == CLUSTER_DISPATCHER
+# Set by serve_cluster for its workers: where the dispatcher listens, and the token that marks
+# a request as forwarded by another worker
+DISPATCHER_URL = os.environ.get('DISPATCHER_URL', '')
+DISPATCH_TOKEN = os.environ.get('DISPATCH_TOKEN', '')
+DISPATCH_TIMEOUT = 300  # seconds the forwarding worker waits on the dispatcher per read
+# Socket.IO message queue URL (redis://, amqp://) shared by the workers; without one they relay
+# events through the database
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+SOCKET_QUEUE_POLL_INTERVAL = 0.1
+SOCKET_QUEUE_RETENTION = 60  # seconds relayed events are kept for slow listeners
+SOCKET_QUEUE_SIZE = 10000  # events waiting for the relay writer before new ones are dropped
+
+
+class SqliteSocketManager(PubSubManager):
+    """Socket.IO client manager that relays events between serving processes through SQLite.
+
+    Stands in for a Redis or AMQP queue on single-host deployments: emits
+    are queued to a writer thread that appends them to socketio_messages,
+    and each process's listener delivers the rows it has not seen yet to
+    its own clients. Emits to a client connected to this process skip the
+    relay.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, channel="flask-socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._pending = queue.Queue(maxsize=SOCKET_QUEUE_SIZE)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.local = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None, **kwargs):
+        if room is not None and self.is_connected(room, namespace or "/"):
+            self.local += 1
+            kwargs["ignore_queue"] = True
+        return super().emit(event, data, namespace=namespace, room=room, skip_sid=skip_sid,
+                            callback=callback, **kwargs)
+
+    def _publish(self, data):
+        """Queue the event for the writer thread; the emitting thread never waits on the database"""
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write, name="socketio-relay", daemon=True)
+                self._writer.start()
+        try:
+            self._pending.put_nowait((json.dumps(data), time.time()))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        conn = open_db_connection()
+        last_prune = 0.0
+        while True:
+            batch = [self._pending.get()]
+            while True:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            now = time.time()
+            try:
+                with conn:
+                    conn.executemany("INSERT INTO socketio_messages (channel, payload, created_at) VALUES (?, ?, ?)",
+                                     [(self.channel, payload, created) for payload, created in batch])
+                    if now - last_prune > SOCKET_QUEUE_RETENTION:
+                        last_prune = now
+                        conn.execute("DELETE FROM socketio_messages WHERE created_at < ?",
+                                     (now - SOCKET_QUEUE_RETENTION,))
+                self.published += len(batch)
+            except sqlite3.Error as e:
+                self.errors += 1
+                log.error(f"Could not relay {len(batch)} Socket.IO events: {e}")
+
+    def _listen(self):
+        conn = open_db_connection()
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM socketio_messages").fetchone()[0]
+        while True:
+            try:
+                rows = conn.execute("SELECT id, payload FROM socketio_messages WHERE id > ? AND channel = ? "
+                                    "ORDER BY id", (last_id, self.channel)).fetchall()
+            except sqlite3.Error as e:
+                self.errors += 1
+                log.error(f"Could not read relayed Socket.IO events: {e}")
+                rows = []
+            for last_id, payload in rows:
+                self.delivered += 1
+                yield payload
+            if not rows:
+                time.sleep(SOCKET_QUEUE_POLL_INTERVAL)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "published": self.published, "delivered": self.delivered,
+                "local": self.local, "pending": self._pending.qsize(), "dropped": self.dropped,
+                "errors": self.errors}
+
+
+def socketio_queue_options() -> dict:
+    """SocketIO keyword arguments that let the serving processes reach each other's clients"""
+    if SOCKETIO_MESSAGE_QUEUE:
+        return {"message_queue": SOCKETIO_MESSAGE_QUEUE}
+    if CLUSTER_MODE:
+        return {"client_manager": SqliteSocketManager()}
+    return {}
+
+
 # --- Flask/Socket ---
 app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder=STATIC_DIR)
 app.config['SECRET_KEY'] = 'your-secret-key-change-this-in-production'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# Hand finished files to the reverse proxy instead of streaming them from Python:
+# '' (serve directly), 'x-sendfile' (Apache/lighttpd) or 'x-accel' (nginx)
+app.config['DOWNLOAD_OFFLOAD'] = os.environ.get('DOWNLOAD_OFFLOAD', '')
+# nginx internal location that aliases DOWNLOAD_DIR, used with 'x-accel'
+app.config['X_ACCEL_PREFIX'] = os.environ.get('X_ACCEL_PREFIX', '/protected-downloads/')
+app.config['USE_X_SENDFILE'] = app.config['DOWNLOAD_OFFLOAD'] == 'x-sendfile'
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', **socketio_queue_options())
+
+
+@app.before_request
+def accept_dispatched_request():
+    """On the dispatcher, give a request forwarded by another worker its client's address back"""
+    token = request.headers.get("X-Dispatch-Token")
+    if DISPATCH_TOKEN and token and secrets.compare_digest(token, DISPATCH_TOKEN):
+        request.environ["REMOTE_ADDR"] = request.headers.get("X-Dispatch-Client", request.remote_addr)
+        g.dispatched = True
+
 
 # --- Platform Configuration ---
-PLATFORM_CONFIGS = {
-    'agasobanuyefilms.com': {
-        'requires_cookies': True,
-        'description': 'Rwandan movie streaming platform',
-        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'referer': 'https://agasobanuyefilms.com/',
-        'headers': {
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-    },
-    'youtube.com': {
-        'requires_cookies': False,
-        'description': 'YouTube platform',
+PLATFORMS_FILE = os.environ.get('PLATFORMS_FILE', os.path.join(BASE_DIR, "platforms.json"))
+PLATFORM_RELOAD_INTERVAL = 5.0  # seconds between mtime checks of PLATFORMS_FILE
+
+# Used for any tunable the file's "defaults" section leaves out
+PLATFORM_TUNABLE_DEFAULTS = {
+    'max_concurrent': 2,  # parallel jobs per platform in the scheduler
+    'concurrent_fragment_downloads': 5,
+    'retries': 20,
+    'fragment_retries': 20,
+    'extractor_retries': 10,
+    'socket_timeout': 30,
+    'rate_limit': None,  # bytes/s per download
+    'bandwidth_cap': None,  # bytes/s shared by all of the platform's transfers
+}
+
+# Tunable name -> yt-dlp option it sets
+TUNABLE_OPTIONS = {
+    'concurrent_fragment_downloads': 'concurrent_fragment_downloads',
+    'retries': 'retries',
+    'fragment_retries': 'fragment_retries',
+    'extractor_retries': 'extractor_retries',
+    'socket_timeout': 'socket_timeout',
+    'rate_limit': 'ratelimit',
+}
+
+BASE_YDL_OPTIONS = {
+    "quiet": True,
+    "no_warnings": True,
+    "ignoreerrors": False,
+    "noplaylist": True,
+    "restrictfilenames": False,
+    "writesubtitles": False,
+    "writethumbnail": False,
+    "merge_output_format": "mp4",
+    "outtmpl": {
+        "default": os.path.join(DOWNLOAD_DIR, "%(title).150B-%(id)s.%(ext)s")
     },
-    'vimeo.com': {
-        'requires_cookies': False,
-        'description': 'Vimeo platform',
+    "retry_sleep_functions": {
+        "http": "linexpbackoff",
+        "fragment": "linexpbackoff",
+        "extractor": "linexpbackoff",
     },
-    'instagram.com': {
-        'requires_cookies': False,
-        'description': 'Instagram - Videos, Photos, Stories',
-        'supports_photos': True
+}
+
+# YouTube-specific extractor configuration, also applied to unconfigured platforms
+YOUTUBE_OPTIONS = {
+    "extractor_args": {
+        "youtube": {
+            "player_client": ["web", "android", "ios", "tv_embedded"],
+            "max_comments": [0],
+        }
     },
-    'pinterest.com': {
-        'requires_cookies': False,
-        'description': 'Pinterest - High-resolution Images',
-        'supports_photos': True
-    }
+    "live_from_start": True,
+    "ignore_no_formats_error": False,
 }
 
 
+class PlatformRegistry:
+    """Platform profiles from PLATFORMS_FILE, compiled once per file version.
+
+    A host resolves by trying it and then each parent domain
+    (a.b.youtube.com, b.youtube.com, youtube.com, com), so only whole labels
+    match and "notyoutube.com" is not YouTube. Every profile gets a finished
+    yt-dlp option template. The file is re-read when its mtime changes; a
+    broken file keeps the previous profiles.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = None  # (profiles, hosts, templates, fallback template, defaults)
+        self._mtime = None
+        self._checked_at = 0.0
+        self.loaded_at = None
+        self.reloads = 0
+        self.errors = 0
+
+    def reload(self, force=False) -> bool:
+        """Recompile if the file changed (or force is set); returns True if new profiles are live"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if not force and self._state is not None and mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            try:
+                raw = {}
+                if mtime is not None:
+                    with open(self.path, encoding="utf-8") as fh:
+                        raw = json.load(fh)
+                state = self._compile(raw)
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                self.errors += 1
+                log.error(f"Could not load platform profiles from {self.path}: {e}")
+                if self._state is None:
+                    self._state = self._compile({})
+                return False
+            self._state = state
+            self.loaded_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.reloads += 1
+        (log.debug if IN_DOWNLOAD_WORKER else log.info)(f"Loaded {len(state[0])} platform profiles from {self.path}")
+        return True
+
+    def _current(self):
+        if self._state is None or time.monotonic() - self._checked_at >= PLATFORM_RELOAD_INTERVAL:
+            self.reload()
+        return self._state
+
+    def _compile(self, raw: dict):
+        defaults = {**PLATFORM_TUNABLE_DEFAULTS, **raw.get("defaults", {})}
+        caps = ffmpeg_capabilities()
+        ffmpeg = {"ffmpeg_location": caps.location} if caps.ffmpeg else {}
+        profiles, hosts, templates = {}, {}, {}
+        for key, config in raw.get("platforms", {}).items():
+            key = key.lower()
+            profile = {**defaults, **config}
+            profiles[key] = MappingProxyType(profile)
+            templates[key] = self._template(key, profile, ffmpeg)
+            for host in (key, *config.get("aliases", ())):
+                hosts[host.lower()] = key
+        return profiles, hosts, templates, self._template(None, defaults, ffmpeg), MappingProxyType(defaults)
+
+    @staticmethod
+    def _template(key, profile: dict, ffmpeg: dict):
+        opts = copy.deepcopy(BASE_YDL_OPTIONS)
+        for name, option in TUNABLE_OPTIONS.items():
+            if profile.get(name) is not None:
+                opts[option] = profile[name]
+
+        headers = {}
+        if 'user_agent' in profile:
+            headers['User-Agent'] = profile['user_agent']
+        headers.update(profile.get('headers', {}))
+        if 'referer' in profile:
+            headers['Referer'] = profile['referer']
+        if headers:
+            opts['http_headers'] = headers
+
+        if key in (None, 'youtube.com'):
+            opts |= copy.deepcopy(YOUTUBE_OPTIONS)
+        return MappingProxyType(opts | ffmpeg)
+
+    def key(self, url):
+        """Profile key for a URL, or its bare domain if no profile covers it"""
+        if not url:
+            return None
+        host = (urlparse(url).hostname or "").rstrip(".")
+        hosts = self._current()[1]
+        suffix = host
+        while suffix:
+            key = hosts.get(suffix)
+            if key:
+                return key
+            suffix = suffix.partition(".")[2]
+        return host[4:] if host.startswith("www.") else host
+
+    def config(self, key):
+        return self._current()[0].get(key) if key else None
+
+    def tunable(self, key, name: str):
+        profiles, _, _, _, defaults = self._current()
+        profile = profiles.get(key) if key else None
+        return (profile or defaults).get(name)
+
+    def options(self, key) -> dict:
+        """Fresh top-level copy of the key's option template; nested values are shared and must not be mutated"""
+        _, _, templates, fallback, _ = self._current()
+        return dict(templates.get(key, fallback) if key else fallback)
+
+    def profiles(self) -> dict:
+        return dict(self._current()[0])
+
+    def stats(self) -> dict:
+        return {
+            "file": self.path,
+            "profiles": len(self._current()[0]),
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "errors": self.errors,
+        }
+
+
+platform_registry = PlatformRegistry(PLATFORMS_FILE)
+
 # --- Database Setup ---
+DB_POOL_SIZE = 8
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE_KB = 16384
+
+# Rollup tables read by the admin pages, maintained by the event writer as rows are inserted
+ROLLUP_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS traffic_daily (
+        day TEXT NOT NULL,
+        page TEXT NOT NULL,
+        visits INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, page)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_download_stats (
+        user_id INTEGER PRIMARY KEY,
+        total_downloads INTEGER NOT NULL DEFAULT 0,
+        successful_downloads INTEGER NOT NULL DEFAULT 0,
+        last_download TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''',
+]
+
+ROLLUP_REBUILD = [
+    "DELETE FROM traffic_daily",
+    '''
+    INSERT INTO traffic_daily (day, page, visits)
+    SELECT DATE(created_at), COALESCE(page, ''), COUNT(*)
+    FROM traffic_stats
+    GROUP BY DATE(created_at), COALESCE(page, '')
+    ''',
+    "DELETE FROM user_download_stats",
+    '''
+    INSERT INTO user_download_stats (user_id, total_downloads, successful_downloads, last_download)
+    SELECT user_id,
+           COUNT(CASE WHEN activity_type = 'download_started' THEN 1 END),
+           COUNT(CASE WHEN activity_type = 'download_completed' THEN 1 END),
+           MAX(created_at)
+    FROM user_activities
+    WHERE user_id IS NOT NULL AND activity_type LIKE 'download_%'
+    GROUP BY user_id
+    ''',
+]
+
+# Applied in order by init_database; PRAGMA user_version records the last one applied
+SCHEMA_MIGRATIONS = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS idx_user_activities_user_created ON user_activities (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_user_activities_created ON user_activities (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_traffic_stats_created ON traffic_stats (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_users_admin_created ON users (is_admin, created_at)",
+    ]),
+    (2, ROLLUP_TABLES + ROLLUP_REBUILD),
+    (3, [
+        "CREATE INDEX IF NOT EXISTS idx_contact_created ON contact_submissions (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_contact_status_created ON contact_submissions (status, created_at, id)",
+    ]),
+    (4, [
+        '''
+        CREATE TABLE IF NOT EXISTS download_jobs (
+            session_id TEXT PRIMARY KEY,
+            job_id TEXT,
+            url TEXT,
+            media TEXT,
+            quality TEXT,
+            cookie_file TEXT,
+            user_id INTEGER,
+            owner TEXT,
+            priority INTEGER,
+            status TEXT NOT NULL,
+            filepath TEXT,
+            filename TEXT,
+            error TEXT,
+            extractor TEXT,
+            media_id TEXT,
+            updated_at REAL NOT NULL
+        )
+        ''',
+    ]),
+    (5, [
+        "ALTER TABLE download_jobs ADD COLUMN files TEXT",
+    ]),
+    (6, [
+        "ALTER TABLE download_jobs ADD COLUMN worker TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_download_jobs_worker ON download_jobs (worker, status)",
+        '''
+        CREATE TABLE IF NOT EXISTS cluster_commands (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            worker TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            command TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS socketio_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_socketio_messages_created ON socketio_messages (created_at)",
+    ]),
+    (7, [
+        "ALTER TABLE download_jobs ADD COLUMN batch_id TEXT",
+        "ALTER TABLE download_jobs ADD COLUMN items TEXT",
+    ]),
+]
+
+
+def open_db_connection():
+    """Open a SQLite connection with the app's performance pragmas applied"""
+    conn = sqlite3.connect(DATABASE_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    # WAL lets readers run alongside the writer; NORMAL is durable across app crashes in WAL mode
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def apply_migrations(conn):
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, statements in SCHEMA_MIGRATIONS:
+        if version <= current:
+            continue
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+        log.info(f"Applied database migration {version}")
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup table from the raw traffic_stats and user_activities rows"""
+    with conn:
+        # Take the write lock up front so no event batch lands between the delete and the insert
+        conn.execute("BEGIN IMMEDIATE")
+        for statement in ROLLUP_REBUILD:
+            conn.execute(statement)
+
+
 def init_database():
     """Initialize the SQLite database with all required tables"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = open_db_connection()
+    conn.execute("PRAGMA journal_mode = WAL")
     cursor = conn.cursor()
 
     # Users table
@@ -153,22 +611,48 @@ def init_database():
         ''', ("admin@eliot", "admin@eliot.com", admin_password_hash, True))
 
     conn.commit()
+    apply_migrations(conn)
     conn.close()
 
 
+class ConnectionPool:
+    """Keeps configured connections alive between requests instead of reconnecting each time"""
+
+    def __init__(self, size=DB_POOL_SIZE):
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            conn = open_db_connection()
+            conn.row_factory = sqlite3.Row
+            return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+
+db_pool = ConnectionPool()
+
+
 def get_db():
     """Get database connection"""
     if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE_PATH)
-        g.db.row_factory = sqlite3.Row
+        g.db = db_pool.acquire()
     return g.db
 
 
 def close_db(e=None):
-    """Close database connection"""
+    """Return the request's database connection to the pool"""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        db_pool.release(db)
 
 
 @app.teardown_appcontext
@@ -206,119 +690,463 @@ def admin_required(f):
     return decorated_function
 
 
+# --- Background Event Writer ---
+EVENT_QUEUE_SIZE = 10000
+EVENT_BATCH_SIZE = 500
+EVENT_FLUSH_INTERVAL = 1.0  # seconds
+EVENT_ENQUEUE_TIMEOUT = 0.05  # how long a request may wait on a full queue before the event is dropped
+EVENT_MAX_ATTEMPTS = 5  # writes of droppable rows while the database stays locked or unavailable
+
+TRAFFIC_INSERT = '''
+    INSERT INTO traffic_stats (ip_address, user_agent, referrer, page)
+    VALUES (?, ?, ?, ?)
+'''
+
+ACTIVITY_INSERT = '''
+    INSERT INTO user_activities
+    (user_id, activity_type, url, format, quality, filename, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+TRAFFIC_ROLLUP = '''
+    INSERT INTO traffic_daily (day, page, visits) VALUES (DATE('now'), ?, 1)
+    ON CONFLICT (day, page) DO UPDATE SET visits = visits + 1
+'''
+
+USER_DOWNLOAD_ROLLUP = '''
+    INSERT INTO user_download_stats (user_id, total_downloads, successful_downloads, last_download)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_downloads = total_downloads + excluded.total_downloads,
+        successful_downloads = successful_downloads + excluded.successful_downloads,
+        last_download = excluded.last_download
+'''
+
+
+class EventWriter:
+    """Buffers analytics inserts and writes them in batched transactions on a background thread"""
+
+    def __init__(self, maxsize=EVENT_QUEUE_SIZE, batch_size=EVENT_BATCH_SIZE, flush_interval=EVENT_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._retry = deque()  # rows of a failed batch, written ahead of the next one
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = object()
+        self.written = 0
+        self.dropped = 0
+        self.backpressure_waits = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.retried = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, sql: str, params: tuple, block=False):
+        """Queue a write. block=True waits for room instead of dropping, for rows that must not be lost."""
+        self.start()
+        item = (sql, params, block, 0)
+        if block:
+            self._queue.put(item)
+            return
+        try:
+            self._queue.put_nowait(item)
+            return
+        except queue.Full:
+            self.backpressure_waits += 1
+        try:
+            self._queue.put(item, timeout=EVENT_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self, timeout=10.0):
+        """Flush everything queued so far and stop the writer thread"""
+        if not self._thread:
+            return
+        self._queue.put(self._stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "written": self.written,
+            "dropped": self.dropped,
+            "backpressure_waits": self.backpressure_waits,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "retried": self.retried,
+            "awaiting_retry": len(self._retry),
+        }
+
+    def _run(self):
+        conn = open_db_connection()
+        try:
+            stopping = False
+            while not stopping:
+                batch = list(self._retry)
+                self._retry.clear()
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is self._stop:
+                        stopping = True
+                        # Drain whatever arrived before the stop marker
+                        while True:
+                            try:
+                                item = self._queue.get_nowait()
+                            except queue.Empty:
+                                break
+                            if item is not self._stop:
+                                batch.append(item)
+                        break
+                    batch.append(item)
+                if batch:
+                    self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        try:
+            self._commit(conn, batch)
+            self.written += len(batch)
+            self.batches += 1
+            return
+        except sqlite3.OperationalError as e:
+            # Locked or unavailable: the rows are fine, try them again ahead of the next batch
+            self.failed_batches += 1
+            retry = [(sql, params, keep, attempts + 1) for sql, params, keep, attempts in batch
+                     if keep or attempts + 1 < EVENT_MAX_ATTEMPTS]
+            self._retry.extend(retry)
+            self.retried += len(retry)
+            self.dropped += len(batch) - len(retry)
+            log.warning(f"Event writer will retry {len(retry)} of {len(batch)} rows: {e}")
+            return
+        except Exception as e:
+            self.failed_batches += 1
+            log.warning(f"Event writer batch of {len(batch)} failed, writing rows one by one: {e}")
+        # A bad row fails the same way every time; write the others around it
+        for item in batch:
+            try:
+                self._commit(conn, [item])
+                self.written += 1
+            except Exception as e:
+                self.dropped += 1
+                (log.error if item[2] else log.warning)(f"Event writer dropped a row ({item[0].split()[0]}): {e}")
+
+    @staticmethod
+    def _commit(conn, batch):
+        # Submission order is kept (a job row's insert lands before its updates); only consecutive
+        # rows of the same statement share an executemany. Raw rows and their rollup updates commit
+        # together, so rollups never drift from the raw tables.
+        with conn:
+            for sql, items in itertools.groupby(batch, key=lambda item: item[0]):
+                conn.executemany(sql, [item[1] for item in items])
+
+
+event_writer = EventWriter()
+atexit.register(event_writer.stop)
+
+
 # --- Traffic Tracking ---
 @app.before_request
 def track_traffic():
     """Track page visits for analytics"""
-    if request.endpoint not in ['static', 'download_file']:
-        try:
-            db = get_db()
-            db.execute('''
-                INSERT INTO traffic_stats (ip_address, user_agent, referrer, page)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                request.remote_addr,
-                request.headers.get('User-Agent', ''),
-                request.headers.get('Referer', ''),
-                request.path
-            ))
-            db.commit()
-        except Exception as e:
-            log.warning(f"Traffic tracking error: {e}")
+    # Forwarded requests were already counted by the worker that received them
+    if request.endpoint not in ['static', 'download_file', 'stream_file'] and not g.get("dispatched"):
+        event_writer.submit(TRAFFIC_INSERT, (
+            request.remote_addr,
+            request.headers.get('User-Agent', ''),
+            request.headers.get('Referer', ''),
+            request.path
+        ))
+        event_writer.submit(TRAFFIC_ROLLUP, (request.path,))
 
 
 # --- Activity Logging ---
 def log_user_activity(user_id, activity_type, **kwargs):
-    """Log user activity to database"""
-    try:
-        db = get_db()
-        db.execute('''
-            INSERT INTO user_activities 
-            (user_id, activity_type, url, format, quality, filename, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
+    """Queue a user activity row; safe to call from download threads"""
+    event_writer.submit(ACTIVITY_INSERT, (
+        user_id,
+        activity_type,
+        kwargs.get('url'),
+        kwargs.get('format'),
+        kwargs.get('quality'),
+        kwargs.get('filename'),
+        kwargs.get('status')
+    ))
+    if user_id and activity_type.startswith('download_'):
+        event_writer.submit(USER_DOWNLOAD_ROLLUP, (
             user_id,
-            activity_type,
-            kwargs.get('url'),
-            kwargs.get('format'),
-            kwargs.get('quality'),
-            kwargs.get('filename'),
-            kwargs.get('status')
+            1 if activity_type == 'download_started' else 0,
+            1 if activity_type == 'download_completed' else 0
         ))
-        db.commit()
-    except Exception as e:
-        log.warning(f"Activity logging error: {e}")
 
 
 # --- Helper Functions ---
-def get_platform_config(url):
-    """Get platform-specific configuration based on URL"""
-    if not url:
-        return None
+def get_platform_key(url):
+    """Get the platform profile key matching a URL, or its bare domain if unconfigured"""
+    return platform_registry.key(url)
 
-    domain = urlparse(url).netloc.lower()
 
-    # Remove www. prefix if present
-    if domain.startswith('www.'):
-        domain = domain[4:]
-
-    # Check for exact matches first
-    if domain in PLATFORM_CONFIGS:
-        return PLATFORM_CONFIGS[domain]
-
-    # Check for subdomain matches
-    for platform, config in PLATFORM_CONFIGS.items():
-        if domain.endswith(platform):
-            return config
-
-    return None
+def get_platform_config(url):
+    """Get platform-specific configuration based on URL"""
+    return platform_registry.config(get_platform_key(url))
 
 
 # --- Cookie Management ---
 ALLOWED_COOKIE_EXTENSIONS = {'txt'}
+DEFAULT_COOKIE_FILE = os.path.join(BASE_DIR, "cookies.txt")
+COOKIE_MAX_AGE = 24 * 3600  # uploaded cookie files are deleted after this many seconds
+COOKIE_SWEEP_INTERVAL = 60
 
 
 def allowed_cookie_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_COOKIE_EXTENSIONS
 
 
-def cleanup_old_cookies():
-    """Remove cookie files older than 24 hours"""
-    try:
-        for filename in os.listdir(COOKIES_DIR):
-            file_path = os.path.join(COOKIES_DIR, filename)
-            if os.path.isfile(file_path):
-                file_age = datetime.now() - datetime.fromtimestamp(os.path.getctime(file_path))
-                if file_age > timedelta(hours=24):
-                    os.remove(file_path)
-                    log.info(f"Removed old cookie file: {filename}")
-    except Exception as e:
-        log.warning(f"Error cleaning up cookies: {e}")
+class SharedCookieJar(YoutubeDLCookieJar):
+    """A job's view of a cached jar: reads the shared cookies in place and copies them on its first write"""
+
+    def __init__(self, base: YoutubeDLCookieJar):
+        super().__init__()
+        self.reset(base)
+
+    def reset(self, base: YoutubeDLCookieJar):
+        """Drop this view's changes and read from base again (a pooled YoutubeDL's next job)"""
+        with self._cookies_lock:
+            self._cookies = base._cookies
+            self._copied = False
+
+    def _own(self):
+        if not self._copied:
+            # Cookie objects are replaced, never changed, so copying the dict levels is enough
+            self._cookies = {domain: {path: dict(names) for path, names in paths.items()}
+                             for domain, paths in self._cookies.items()}
+            self._copied = True
+
+    def set_cookie(self, cookie):
+        with self._cookies_lock:
+            self._own()
+            super().set_cookie(cookie)
+
+    def clear(self, domain=None, path=None, name=None):
+        with self._cookies_lock:
+            self._own()
+            super().clear(domain, path, name)
+
+
+class CookieJarCache:
+    """Parsed cookie files keyed by path and mtime, so a shared cookies.txt is parsed once, not per job.
+
+    Jobs get a SharedCookieJar; it has no filename, so nothing a job
+    receives is ever written back to the file.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jars = {}  # path -> (mtime_ns, parsed jar)
+        self.parses = 0
+        self.hits = 0
+
+    def parsed(self, path: str) -> YoutubeDLCookieJar:
+        """The shared parse of path; read-only, hand jobs a SharedCookieJar over it"""
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._jars.get(path)
+            if cached and cached[0] == mtime:
+                self.hits += 1
+                return cached[1]
+        jar = YoutubeDLCookieJar(path)
+        jar.load()
+        jar.clear_expired_cookies()
+        with self._lock:
+            self._jars[path] = (mtime, jar)
+            self.parses += 1
+        return jar
+
+    def view(self, path: str) -> SharedCookieJar:
+        return SharedCookieJar(self.parsed(path))
+
+    def invalidate(self, path: str):
+        with self._lock:
+            self._jars.pop(path, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._jars), "parses": self.parses, "hits": self.hits}
+
+
+cookie_jars = CookieJarCache()
+
+
+class CookieIndex:
+    """In-memory list of the usable cookie files, so requests never scan COOKIES_DIR.
+
+    Uploads and deletions update it directly. A background sweeper removes
+    uploads older than COOKIE_MAX_AGE and picks up files added or removed
+    by hand; it only lists the directory when the directory's mtime has
+    moved or an upload is due to expire.
+    """
+
+    def __init__(self, directory=COOKIES_DIR, default_file=DEFAULT_COOKIE_FILE,
+                 max_age=COOKIE_MAX_AGE, interval=COOKIE_SWEEP_INTERVAL):
+        self.directory = directory
+        self.default_file = default_file
+        self.max_age = max_age
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._entries = {}  # name -> entry for uploaded files
+        self._expires = {}  # name -> time the upload gets deleted
+        self._has_default = False
+        self._listing = ()
+        self._dir_mtime = None
+        self.scans = 0
+        self.expired = 0
+        self.last_sweep = None
+
+    def start(self):
+        with self._start_lock:
+            if self._thread:
+                return
+            # First listing happens before anyone reads the index
+            self.sweep()
+            self._thread = threading.Thread(target=self._run, name="cookie-index", daemon=True)
+            self._thread.start()
+
+    def cookies(self) -> tuple:
+        """Default cookies.txt first, then uploads newest first"""
+        self.start()
+        return self._listing
+
+    def resolve(self, name: str):
+        """Path of the named cookie file, or None if it is not in the index"""
+        self.start()
+        with self._lock:
+            if name == "default":
+                return self.default_file if self._has_default else None
+            entry = self._entries.get(name)
+            return entry["path"] if entry else None
+
+    def add(self, filename: str):
+        path = os.path.join(self.directory, filename)
+        st = os.stat(path)
+        cookie_jars.invalidate(path)
+        with self._lock:
+            self._put(filename[:-4], path, st)
+            self._rebuild()
+
+    def remove(self, name: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            self._expires.pop(name, None)
+            if entry:
+                self._rebuild()
+        if not entry:
+            return False
+        cookie_jars.invalidate(entry["path"])
+        try:
+            os.remove(entry["path"])
+        except FileNotFoundError:
+            pass
+        return True
 
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cookies": len(self._entries),
+                "default": self._has_default,
+                "scans": self.scans,
+                "expired": self.expired,
+                "last_sweep": self.last_sweep,
+            }
 
-def get_available_cookies():
-    """Get list of available cookie files"""
-    cookies = []
-    # Default cookies.txt in base directory
-    default_cookies = os.path.join(BASE_DIR, "cookies.txt")
-    if os.path.exists(default_cookies):
-        cookies.append({"name": "default", "path": default_cookies, "uploaded": False})
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                log.warning(f"Error sweeping cookies: {e}")
+
+    def sweep(self):
+        now = time.time()
+        has_default = os.path.isfile(self.default_file)
+        dir_mtime = self._stat_dir()
+        with self._lock:
+            due = any(expires <= now for expires in self._expires.values())
+            if dir_mtime == self._dir_mtime and not due:
+                self._has_default = has_default
+                self._rebuild()
+                self.last_sweep = now
+                return
+
+        entries = {}
+        with os.scandir(self.directory) as it:
+            for de in it:
+                if not de.is_file():
+                    continue
+                st = de.stat()
+                if now - st.st_ctime > self.max_age:
+                    cookie_jars.invalidate(de.path)
+                    try:
+                        os.remove(de.path)
+                        self.expired += 1
+                        log.info(f"Removed old cookie file: {de.name}")
+                    except OSError as e:
+                        log.warning(f"Error removing old cookie file {de.name}: {e}")
+                elif de.name.endswith('.txt'):
+                    entries[de.name[:-4]] = (de.path, st)
+
+        with self._lock:
+            self._entries.clear()
+            self._expires.clear()
+            for name, (path, st) in entries.items():
+                self._put(name, path, st)
+            self._has_default = has_default
+            # The mtime from before the listing: anything that changed the directory since is seen next sweep
+            self._dir_mtime = dir_mtime
+            self._rebuild()
+            self.scans += 1
+            self.last_sweep = now
+
+    def _stat_dir(self):
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def _put(self, name: str, path: str, st):
+        self._entries[name] = {
+            "name": name,
+            "path": path,
+            "uploaded": True,
+            "upload_time": datetime.fromtimestamp(st.st_ctime).strftime("%Y-%m-%d %H:%M"),
+        }
+        self._expires[name] = st.st_ctime + self.max_age
+
+    def _rebuild(self):
+        uploads = sorted(self._entries.values(), key=lambda e: self._expires[e["name"]], reverse=True)
+        default = [{"name": "default", "path": self.default_file, "uploaded": False}] if self._has_default else []
+        self._listing = tuple(default + uploads)
 
-    # Uploaded cookie files
-    try:
-        for filename in os.listdir(COOKIES_DIR):
-            if filename.endswith('.txt'):
-                file_path = os.path.join(COOKIES_DIR, filename)
-                cookies.append({
-                    "name": filename[:-4],  # Remove .txt extension
-                    "path": file_path,
-                    "uploaded": True,
-                    "upload_time": datetime.fromtimestamp(os.path.getctime(file_path)).strftime("%Y-%m-%d %H:%M")
-                })
-    except Exception as e:
-        log.warning(f"Error reading cookies directory: {e}")
 
-    return cookies
+cookie_index = CookieIndex()
 
 
 # --- Sessions ---
@@ -327,26 +1155,178 @@ class DownloadProgress:
         self.session_id = sid
         self.status = "queued"
         self.progress = 0.0
-        self.speed = "N/A"
-        self.eta = "N/A"
-        self.file_size = "N/A"
-        self.downloaded = "0 B"
+        self.speed = None  # bytes/s
+        self.eta = None  # seconds
+        self.total_bytes = None
+        self.downloaded_bytes = 0
         self.error = None
         self.filename = ""
         self.filepath = ""
+        self.files = []  # every file a multi-item post (carousel, gallery) produced; filepath is the first
         self.cookie_file = None
+        self.queue_position = None
+        self.queue_eta = None
+        self.user_id = None
+        # Client sessions point at the job doing the work; jobs list the sessions they serve
+        self.job_id = None
+        self.subscribers = []
+        self.request_key = None
+        self.last_emit = 0.0
+        self.last_emitted_status = None
+        self.url = None
+        self.media = None
+        self.quality = None
+        self.owner = None
+        self.priority = None
+        self.artifact = None  # artifact_key() of the finished file
+        self.batch_id = None  # parent session of a playlist item
+        self.items_total = None  # set on playlist parent sessions only
+        self.items_done = None
+        self.items_failed = None
+        self.stream_format = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.processes = []  # child processes (ffmpeg) started for this job
+        self.created_at = time.time()
+        self.timer = None
+        self.output_base = None
+        self.worker = WORKER_NAME  # serving process that owns the session
 
 
 download_sessions = {}
 
+# Minimum seconds between progress_update events of a job, besides status changes
+PROGRESS_EMIT_INTERVAL = float(os.environ.get('PROGRESS_EMIT_INTERVAL', 0.5))
+
+MIRRORED_FIELDS = ("status", "progress", "speed", "eta", "total_bytes", "downloaded_bytes",
+                   "error", "filename", "filepath", "files", "queue_position", "queue_eta")
+
+
+def fan_out(job_prog: DownloadProgress) -> list:
+    """Copy a job's state onto every client session attached to it and return those sessions"""
+    if not job_prog.subscribers:
+        return [job_prog]
+    targets = []
+    for sid in list(job_prog.subscribers):
+        sub = download_sessions.get(sid)
+        if not sub:
+            continue
+        for field in MIRRORED_FIELDS:
+            setattr(sub, field, getattr(job_prog, field))
+        targets.append(sub)
+    return targets
+
+
+# --- FFmpeg Capabilities ---
+FFMPEG_PROBE_TIMEOUT = 10  # seconds per ffmpeg invocation
+FFMPEG_VERSION_RE = re.compile(r"^ff\w+ version (\S+)")
+# "  E mp4             MP4 (MPEG-4 Part 14)" / " V....D libx264   libx264 H.264 ..."
+FFMPEG_LIST_RE = re.compile(r"^\s*([A-Z.]{1,6})\s+(\S+)\s")
+
+
+def find_binary(name: str):
+    """The bundled binary in FFMPEG_DIR, else the one on PATH"""
+    for candidate in (name, f"{name}.exe"):
+        path = os.path.join(FFMPEG_DIR, candidate)
+        if os.path.isfile(path):
+            return path
+    return shutil.which(name)
+
+
+def run_probe(args: list) -> str:
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=FFMPEG_PROBE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError) as e:
+        log.warning(f"ffmpeg probe {' '.join(args[1:])} failed: {e}")
+        return ""
+    return result.stdout
+
+
+def parse_ffmpeg_list(output: str) -> frozenset:
+    """Names from `ffmpeg -muxers`/`-encoders`; entries start after the dashed separator line"""
+    names = set()
+    lines = output.splitlines()
+    for i, line in enumerate(lines):
+        if line.strip() and not line.strip("- "):
+            lines = lines[i + 1:]
+            break
+    for line in lines:
+        match = FFMPEG_LIST_RE.match(line)
+        if match:
+            # Muxers may list aliases as "matroska,webm"
+            names.update(match.group(2).split(","))
+    return frozenset(names)
+
+
+class FFmpegCapabilities:
+    """What the installed ffmpeg/ffprobe can do, probed once and reused for every job"""
+
+    def __init__(self, ffmpeg=None, ffprobe=None, version=None, muxers=frozenset(), encoders=frozenset()):
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.version = version
+        self.muxers = muxers
+        self.encoders = encoders
+        self.probed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    @classmethod
+    def probe(cls):
+        ffmpeg = find_binary("ffmpeg")
+        if not ffmpeg:
+            return cls(ffprobe=find_binary("ffprobe"))
+        match = FFMPEG_VERSION_RE.match(run_probe([ffmpeg, "-hide_banner", "-version"]))
+        return cls(
+            ffmpeg=ffmpeg,
+            ffprobe=find_binary("ffprobe"),
+            version=match.group(1) if match else None,
+            muxers=parse_ffmpeg_list(run_probe([ffmpeg, "-hide_banner", "-muxers"])),
+            encoders=parse_ffmpeg_list(run_probe([ffmpeg, "-hide_banner", "-encoders"])),
+        )
+
+    @property
+    def location(self):
+        return os.path.dirname(self.ffmpeg) if self.ffmpeg else None
+
+    @property
+    def merge_container(self):
+        """Container separate video/audio streams are copied into, or None if they cannot be merged"""
+        if not self.ffmpeg:
+            return None
+        if "mp4" in self.muxers or not self.muxers:
+            # An ffmpeg whose muxer list could not be read is assumed to be a standard build
+            return "mp4"
+        return "mkv" if "matroska" in self.muxers else None
+
+    def as_dict(self) -> dict:
+        return {
+            "ffmpeg": self.ffmpeg,
+            "ffprobe": self.ffprobe,
+            "version": self.version,
+            "merge_container": self.merge_container,
+            "muxers": len(self.muxers),
+            "encoders": len(self.encoders),
+            "probed_at": self.probed_at,
+        }
+
+
+_ffmpeg_caps = None
+_ffmpeg_caps_lock = threading.Lock()
+
+
+def ffmpeg_capabilities(refresh=False) -> FFmpegCapabilities:
+    global _ffmpeg_caps
+    with _ffmpeg_caps_lock:
+        if _ffmpeg_caps is None or refresh:
+            _ffmpeg_caps = FFmpegCapabilities.probe()
+            (log.debug if IN_DOWNLOAD_WORKER else log.info)(f"FFmpeg probe: {_ffmpeg_caps.as_dict()}")
+        return _ffmpeg_caps
+
 
-# --- Utility Functions ---
 def has_ffmpeg() -> bool:
-    return (
-            shutil.which("ffmpeg") is not None
-            or os.path.exists(os.path.join(FFMPEG_DIR, "ffmpeg"))
-            or os.path.exists(os.path.join(FFMPEG_DIR, "ffmpeg.exe"))
-    )
+    return ffmpeg_capabilities().ffmpeg is not None
+
+
+# --- Utility Functions ---
 
 
 def fmt_bytes(n: int | float | None) -> str:
@@ -365,6 +1345,8 @@ def progress_hook(d, session_id: str):
     prog = download_sessions.get(session_id)
     if not prog:
         return
+    # Raising here makes yt-dlp abandon the transfer (and any remaining fragments) right away
+    check_cancelled(prog)
 
     try:
         status = d.get("status", "")
@@ -374,14 +1356,16 @@ def progress_hook(d, session_id: str):
             total = d.get("total_bytes") or d.get("total_bytes_estimate")
             downloaded = d.get("downloaded_bytes") or 0
             prog.progress = (downloaded / total * 100) if total else prog.progress
-            prog.file_size = fmt_bytes(total)
-            prog.downloaded = fmt_bytes(downloaded)
-            prog.speed = d.get("_speed_str", "N/A")
-            prog.eta = d.get("_eta_str", "N/A")
+            prog.total_bytes = total
+            prog.downloaded_bytes = downloaded
+            prog.speed = d.get("speed")
+            prog.eta = d.get("eta")
 
         elif status == "finished":
             prog.status = "processing"
             prog.progress = 100.0
+            prog.downloaded_bytes = d.get("total_bytes") or d.get("downloaded_bytes") or prog.downloaded_bytes
+            prog.eta = 0
             prog.filepath = d.get("filename") or prog.filepath
 
         elif status == "error":
@@ -389,65 +1373,58 @@ def progress_hook(d, session_id: str):
             prog.error = "Download error"
 
     finally:
-        socketio.emit("progress_update", {
-            "session_id": session_id,
-            "status": prog.status,
-            "progress": round(prog.progress, 1),
-            "speed": prog.speed,
-            "eta": prog.eta,
-            "file_size": prog.file_size,
-            "downloaded": prog.downloaded,
-            "filename": prog.filename,
-            "error": prog.error
-        })
+        emit_progress(prog)
+
+
+def progress_payload(prog: DownloadProgress) -> dict:
+    """Compact progress event; sizes, speed and ETA are raw numbers formatted by the client"""
+    payload = {
+        "session_id": prog.session_id,
+        "status": prog.status,
+        "progress": round(prog.progress, 1),
+        "downloaded_bytes": prog.downloaded_bytes,
+        "total_bytes": prog.total_bytes,
+        "speed": round(prog.speed) if prog.speed else None,
+        "eta": prog.eta,
+        "filename": prog.filename,
+        "error": prog.error,
+        "queue_position": prog.queue_position,
+        "queue_eta": prog.queue_eta,
+        "items_total": prog.items_total,
+        "items_done": prog.items_done,
+        "items_failed": prog.items_failed
+    }
+    return {k: v for k, v in payload.items() if v is not None}
 
 
-def ydl_base_opts(cookie_file_path=None, url=None):
-    """Enhanced options with platform-specific configurations"""
-    # Get platform configuration
-    platform_config = get_platform_config(url) if url else None
-
-    # Base configuration
-    base_opts = {
-        "quiet": True,
-        "no_warnings": True,
-        "ignoreerrors": False,
-        "noplaylist": True,
-        "restrictfilenames": False,
-        "writesubtitles": False,
-        "writethumbnail": False,
-        "merge_output_format": "mp4",
-        "outtmpl": {
-            "default": os.path.join(DOWNLOAD_DIR, "%(title).150B-%(id)s.%(ext)s")
-        },
-        "concurrent_fragment_downloads": 5,
-        "retries": 20,
-        "fragment_retries": 20,
-        "extractor_retries": 10,
-        "retry_sleep_functions": {
-            "http": "linexpbackoff",
-            "fragment": "linexpbackoff",
-            "extractor": "linexpbackoff",
-        },
-        "socket_timeout": 30,
-    }
+def emit_progress(prog: DownloadProgress, force=False):
+    """Send progress to the rooms of every session following this job.
 
-    # Add platform-specific configurations
-    if platform_config:
-        # Add user agent if specified
-        if 'user_agent' in platform_config:
-            base_opts['http_headers'] = base_opts.get('http_headers', {})
-            base_opts['http_headers']['User-Agent'] = platform_config['user_agent']
+    Updates within PROGRESS_EMIT_INTERVAL of the previous one are dropped
+    unless the status changed or force is set, so yt-dlp's per-chunk hook
+    calls collapse into a few events per second.
+    """
+    now = time.monotonic()
+    if (not force and prog.status == prog.last_emitted_status
+            and now - prog.last_emit < PROGRESS_EMIT_INTERVAL):
+        return
+    prog.last_emit = now
+    if prog.status != prog.last_emitted_status:
+        persist_progress(prog)
+    prog.last_emitted_status = prog.status
+    for target in fan_out(prog):
+        payload = progress_payload(target)
+        socketio.emit("progress_update", payload, to=target.session_id)
+        if target.batch_id:
+            socketio.emit("batch_item_update", payload, to=target.batch_id)
+            update_batch(target.batch_id)
 
-        # Add custom headers
-        if 'headers' in platform_config:
-            base_opts['http_headers'] = base_opts.get('http_headers', {})
-            base_opts['http_headers'].update(platform_config['headers'])
 
-        # Add referer if specified
-        if 'referer' in platform_config:
-            base_opts['http_headers'] = base_opts.get('http_headers', {})
-            base_opts['http_headers']['Referer'] = platform_config['referer']
+def ydl_base_opts(cookie_file_path=None, url=None):
+    """Enhanced options with platform-specific configurations"""
+    platform_key = get_platform_key(url) if url else None
+    platform_config = platform_registry.config(platform_key)
+    base_opts = platform_registry.options(platform_key)
 
     # Handle cookies
     cookie_part = {}
@@ -458,9 +1435,8 @@ def ydl_base_opts(cookie_file_path=None, url=None):
             log.info(f"Using cookies for {urlparse(url).netloc}")
         else:
             # Check for default cookies
-            default_cookies = os.path.join(BASE_DIR, "cookies.txt")
-            if os.path.exists(default_cookies):
-                cookie_part = {"cookiefile": default_cookies}
+            if os.path.exists(DEFAULT_COOKIE_FILE):
+                cookie_part = {"cookiefile": DEFAULT_COOKIE_FILE}
                 log.info(f"Using default cookies for {urlparse(url).netloc}")
             else:
                 log.warning(f"Platform {urlparse(url).netloc} may require cookies for full access")
@@ -468,21 +1444,18 @@ def ydl_base_opts(cookie_file_path=None, url=None):
         # Cookie file provided, use it regardless
         cookie_part = {"cookiefile": cookie_file_path}
 
-    # FFmpeg configuration
-    ffmpeg_part = {"ffmpeg_location": FFMPEG_DIR} if has_ffmpeg() else {}
+    return base_opts | cookie_part
 
-    # YouTube-specific extractor configuration
-    if not platform_config or 'youtube.com' in (url or ''):
-        base_opts["extractor_args"] = {
-            "youtube": {
-                "player_client": ["web", "android", "ios", "tv_embedded"],
-                "max_comments": [0],
-            }
-        }
-        base_opts["live_from_start"] = True
-        base_opts["ignore_no_formats_error"] = False
 
-    return {**base_opts, **cookie_part, **ffmpeg_part}
+def open_ydl(opts: dict) -> yt_dlp.YoutubeDL:
+    """YoutubeDL for the options from ydl_base_opts, taking its cookies from the shared jar cache"""
+    cookie_file = opts.pop("cookiefile", None)
+    # YoutubeDL normalises nested options such as outtmpl in place; keep the platform templates intact
+    ydl = yt_dlp.YoutubeDL({k: v if k in HOOK_OPTIONS else copy.deepcopy(v) for k, v in opts.items()})
+    if cookie_file:
+        # cookiejar is a cached property; with no cookiefile in params, close() has nothing to save
+        ydl.__dict__["cookiejar"] = cookie_jars.view(cookie_file)
+    return ydl
 
 
 def check_platform_requirements(url):
@@ -497,11 +1470,8 @@ def check_platform_requirements(url):
         }
 
     if platform_config.get('requires_cookies', False):
-        # Check if cookies are available
-        available_cookies = get_available_cookies()
-        default_cookies = os.path.join(BASE_DIR, "cookies.txt")
-
-        has_cookies = len(available_cookies) > 0 or os.path.exists(default_cookies)
+        # Check if cookies are available (the index includes the default cookies.txt)
+        has_cookies = len(cookie_index.cookies()) > 0
 
         if has_cookies:
             return {
@@ -525,26 +1495,59 @@ def check_platform_requirements(url):
 
 def build_video_format(quality: str) -> str:
     """Robust format selector that merges best video+audio, honoring a max height."""
-    if quality == "best":
-        return "bv*+ba/b"
     # quality like "1080p", "720p"
-    h = "".join(ch for ch in quality if ch.isdigit())
+    h = "".join(ch for ch in quality if ch.isdigit()) if quality != "best" else ""
+    height = f"[height<={h}]" if h else ""
+    if not ffmpeg_capabilities().merge_container:
+        # Nothing to merge with: only formats that already carry both streams
+        return f"b{height}/b"
     if not h:
         return "bv*+ba/b"
-    # prefer mp4 where possible, fallback otherwise
     # pick best video up to height, then best audio
-    return f"((bv*[height<={h}][ext=mp4]/bv*[height<={h}])+(ba[ext=m4a]/ba))/b[height<={h}]"
+    return f"(bv*{height}+ba)/b{height}"
+
+
+def build_video_opts(quality: str) -> dict:
+    """Format selection plus the sort order that keeps the merge a stream copy.
+
+    Resolution and frame rate still win; among equal ones, MP4-family video
+    with M4A audio is preferred when merging into MP4, so ffmpeg only
+    remuxes the streams instead of needing an incompatible codec pair.
+    """
+    opts = {"format": build_video_format(quality)}
+    container = ffmpeg_capabilities().merge_container
+    if container:
+        opts["merge_output_format"] = container
+    if container == "mp4":
+        opts["format_sort"] = ["res", "fps", "ext:mp4:m4a"]
+    return opts
+
+
+def build_audio_opts(quality: str = "best"):
+    """Audio keeps the source codec unless MP3 is asked for explicitly.
+
+    "best" takes the best audio stream as-is, "m4a" prefers AAC for players
+    without Opus support, and "mp3" transcodes. The native modes only
+    remux with ffmpeg (preferredcodec "best" copies the stream into a
+    matching .opus/.m4a/.ogg container), so they cost I/O, not CPU.
+    """
+    caps = ffmpeg_capabilities()
+    if quality == "mp3":
+        if caps.ffmpeg and ("libmp3lame" in caps.encoders or not caps.encoders):
+            return {
+                "format": "bestaudio/best",
+                "postprocessors": [{
+                    "key": "FFmpegExtractAudio",
+                    "preferredcodec": "mp3",
+                    "preferredquality": "192"
+                }]
+            }
+        log.warning("MP3 requested but no ffmpeg with an MP3 encoder is available; keeping the original audio codec")
 
-
-def build_audio_opts():
-    return {
-        "format": "bestaudio/best",
-        "postprocessors": [{
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-            "preferredquality": "192"
-        }]
-    }
+    opts = {"format": "ba[ext=m4a]/ba[acodec^=mp4a]/ba/b" if quality == "m4a" else "ba/b"}
+    if caps.ffmpeg:
+        opts["postprocessors"] = [{"key": "FFmpegExtractAudio", "preferredcodec": "best"}]
+    return opts
 
 
 def build_photo_opts():
@@ -556,81 +1559,1248 @@ def build_photo_opts():
     }
 
 
+# --- YoutubeDL Pool ---
+YDL_POOL_IDLE_PER_PROFILE = 4
+YDL_POOL_MAX_IDLE = 32  # idle instances over all profiles; least recently used profiles go first
+YDL_POOL_MAX_USES = 100  # extractor instances keep caches, so retire an instance after this many leases
+
+# Set per lease instead of being part of the profile
+HOOK_OPTIONS = ("progress_hooks", "post_hooks", "postprocessor_hooks", "logger")
+JOB_PARAMS = ("concurrent_fragment_downloads",)
+JOB_SCOPED_OPTIONS = HOOK_OPTIONS + JOB_PARAMS
+
+
+class HookRelay:
+    """The hooks and logger a pooled YoutubeDL is built with; each lease points them at its own"""
+
+    def __init__(self):
+        self.bind({})
+
+    def bind(self, opts: dict):
+        self.progress_hooks = list(opts.get("progress_hooks") or ())
+        self.post_hooks = list(opts.get("post_hooks") or ())
+        self.postprocessor_hooks = list(opts.get("postprocessor_hooks") or ())
+        self.logger = opts.get("logger")
+
+    def progress(self, d):
+        for hook in self.progress_hooks:
+            hook(d)
+
+    def post(self, filename):
+        for hook in self.post_hooks:
+            hook(filename)
+
+    def postprocess(self, d):
+        for hook in self.postprocessor_hooks:
+            hook(d)
+
+    def debug(self, msg: str):
+        if self.logger:
+            self.logger.debug(msg)
+
+    def info(self, msg: str):
+        if self.logger:
+            self.logger.info(msg)
+
+    def warning(self, msg: str):
+        if self.logger:
+            self.logger.warning(msg)
+        else:
+            log.debug(f"yt-dlp: {msg}")
+
+    def error(self, msg: str):
+        if self.logger:
+            self.logger.error(msg)
+        else:
+            log.debug(f"yt-dlp: {msg}")
+
+
+class PooledYdl:
+    def __init__(self, ydl, relay: HookRelay, jar):
+        self.ydl = ydl
+        self.relay = relay
+        self.jar = jar
+        self.uses = 0
+
+
+def _profile_value(value):
+    return dict(value) if isinstance(value, MappingProxyType) else repr(value)
+
+
+class YdlPool:
+    """Idle YoutubeDL instances keyed by their compiled options.
+
+    Building a YoutubeDL sets up the extractor registry, format selector,
+    postprocessors and output template. An idle instance built from the
+    same options (platform template, cookie file, media/quality options)
+    is reused instead. Hooks, the logger and the fragment concurrency
+    vary per job and are rebound on every lease. The cookie jar is reset
+    to the shared parse. An instance whose lease raised is closed rather
+    than reused, since a failed or cancelled run may leave it mid-state.
+    """
+
+    def __init__(self, idle_per_profile=YDL_POOL_IDLE_PER_PROFILE, max_idle=YDL_POOL_MAX_IDLE,
+                 max_uses=YDL_POOL_MAX_USES):
+        self.idle_per_profile = idle_per_profile
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self._lock = threading.Lock()
+        self._idle = OrderedDict()  # profile -> idle instances, least recently used profile first
+        self._build_seconds = None  # EWMA of a cold build
+        self.hits = 0
+        self.misses = 0
+        self.retired = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def profile(opts: dict) -> str:
+        compiled = {k: v for k, v in opts.items() if k not in JOB_SCOPED_OPTIONS}
+        return json.dumps(compiled, sort_keys=True, default=_profile_value)
+
+    @contextlib.contextmanager
+    def lease(self, opts: dict):
+        """Yield a YoutubeDL for opts (as built by ydl_base_opts); use it only inside the with block"""
+        key = self.profile(opts)
+        pooled = self._checkout(key, opts)
+        healthy = False
+        try:
+            # Inside the try: a cookie file deleted since the profile was built must not leak the instance
+            pooled.relay.bind(opts)
+            pooled.ydl.params.update({name: opts[name] for name in JOB_PARAMS if name in opts})
+            if pooled.jar is not None:
+                pooled.jar.reset(cookie_jars.parsed(opts["cookiefile"]))
+            yield pooled.ydl
+            healthy = True
+        finally:
+            pooled.relay.bind({})
+            pooled.uses += 1
+            self._checkin(key, pooled, healthy)
+
+    def warm(self, opts: dict):
+        key = self.profile(opts)
+        with self._lock:
+            if self._idle.get(key):
+                return
+        self._checkin(key, self._build(opts), True)
+
+    def _checkout(self, key: str, opts: dict) -> PooledYdl:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.hits += 1
+                self.saved_seconds += self._build_seconds or 0.0
+                pooled = idle.pop()
+                if not idle:
+                    del self._idle[key]
+                return pooled
+            self.misses += 1
+        return self._build(opts)
+
+    def _build(self, opts: dict) -> PooledYdl:
+        started = time.perf_counter()
+        relay = HookRelay()
+        build_opts = {k: v for k, v in opts.items() if k not in JOB_SCOPED_OPTIONS}
+        build_opts |= {
+            "progress_hooks": [relay.progress],
+            "post_hooks": [relay.post],
+            "postprocessor_hooks": [relay.postprocess],
+            "logger": relay,
+        }
+        ydl = open_ydl(build_opts)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._build_seconds = elapsed if self._build_seconds is None else \
+                0.8 * self._build_seconds + 0.2 * elapsed
+        return PooledYdl(ydl, relay, ydl.__dict__.get("cookiejar"))
+
+    def _checkin(self, key: str, pooled: PooledYdl, healthy: bool):
+        retire = [pooled]
+        if healthy and pooled.uses < self.max_uses:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                self._idle.move_to_end(key)
+                if len(idle) < self.idle_per_profile:
+                    idle.append(pooled)
+                    retire = self._trim()
+        for old in retire:
+            self.retired += 1
+            old.ydl.close()
+
+    def _trim(self) -> list:
+        """Caller holds the lock; returns the instances dropped to stay within max_idle"""
+        dropped = []
+        while sum(len(idle) for idle in self._idle.values()) > self.max_idle:
+            key, idle = next(iter(self._idle.items()))
+            dropped.append(idle.pop(0))
+            if not idle:
+                del self._idle[key]
+        return dropped
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "profiles": len(self._idle),
+                "idle": sum(len(idle) for idle in self._idle.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "retired": self.retired,
+                "build_ms": round(self._build_seconds * 1000, 1) if self._build_seconds else None,
+                "saved_seconds": round(self.saved_seconds, 2),
+            }
+
+
+ydl_pool = YdlPool()
+
+
+def warm_ydl_pool():
+    """Build the analyze and default download instances for every configured platform"""
+    started = time.perf_counter()
+    for key in [None, *platform_registry.profiles()]:
+        url = f"https://{key}/" if key else None
+        try:
+            ydl_pool.warm(ydl_base_opts(None, url) | {"skip_download": True})
+            for media in ("video", "audio"):
+                ydl_pool.warm(build_download_opts(url, media, "best"))
+        except Exception as e:
+            log.warning(f"Could not warm YoutubeDL for {key or 'generic'}: {e}")
+    log.info(f"Warmed YoutubeDL pool in {time.perf_counter() - started:.1f}s: {ydl_pool.stats()}")
+
+
+# --- Metadata Cache ---
+METADATA_CACHE_TTL = 600  # seconds; stream URLs from most extractors expire after a few hours
+METADATA_NEGATIVE_TTL = 60
+METADATA_CACHE_SIZE = 256
+TRACKING_QUERY_PARAMS = {'si', 'feature', 'fbclid', 'gclid', 'igshid', 'igsh', 'pp'}
+PERMANENT_ERROR_MARKERS = ('private', 'unavailable')
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for cache keys: lowercase host without www., no fragment or tracking params"""
+    parts = urlparse(url.strip())
+    netloc = parts.netloc.lower()
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in TRACKING_QUERY_PARAMS and not k.startswith('utm_')
+    )
+    return urlunparse((parts.scheme.lower(), netloc, parts.path, parts.params, urlencode(query), ''))
+
+
+def cookie_identity(cookie_file_path):
+    """Identify a cookie file by path and mtime so re-uploaded cookies miss the cache"""
+    if not cookie_file_path:
+        return None
+    try:
+        return cookie_file_path, os.path.getmtime(cookie_file_path)
+    except OSError:
+        return cookie_file_path, None
+
+
+class MetadataCache:
+    """LRU cache of sanitized yt-dlp info dicts with a short-lived negative cache"""
+
+    def __init__(self, max_entries=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL, negative_ttl=METADATA_NEGATIVE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, info or None, error or None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(url: str, cookie_file_path=None):
+        return normalize_url(url), cookie_identity(cookie_file_path)
+
+    def get(self, key):
+        """Return a private copy of the cached info, None on miss, or raise the cached failure"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            _, info, error = entry
+        if error:
+            raise yt_dlp.utils.DownloadError(error)
+        return copy.deepcopy(info)
+
+    @classmethod
+    def sanitize(cls, info: dict) -> dict:
+        # Same cleanup yt-dlp applies to --load-info-json so the dict can be re-processed
+        clean = yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True)
+        if info.get("entries") is not None:
+            # ...which drops a playlist's entries; a cached carousel needs them to be downloaded again
+            clean["entries"] = [cls.sanitize(e) for e in info["entries"] if e]
+        return clean
+
+    def put(self, key, info: dict):
+        self._store(key, (time.time() + self.ttl, self.sanitize(info), None))
+
+    def put_error(self, key, error: str):
+        self._store(key, (time.time() + self.negative_ttl, None, error))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+metadata_cache = MetadataCache()
+
+
+def is_permanent_extraction_error(message: str) -> bool:
+    message = message.lower()
+    return any(marker in message for marker in PERMANENT_ERROR_MARKERS)
+
+
 def extract_info_only(url: str, cookie_file_path=None) -> dict:
+    key = MetadataCache.key(url, cookie_file_path)
+    info = metadata_cache.get(key)
+    if info is not None:
+        return info
+
     opts = ydl_base_opts(cookie_file_path, url) | {"skip_download": True}
-    with yt_dlp.YoutubeDL(opts) as ydl:
-        info = ydl.extract_info(url, download=False)
+    try:
+        with ydl_pool.lease(opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        if is_permanent_extraction_error(str(e)):
+            metadata_cache.put_error(key, str(e))
+        raise
+    metadata_cache.put(key, info)
     return info
 
 
-def download_job(url: str, media: str, quality: str, session_id: str, cookie_file_path=None):
-    prog = download_sessions[session_id]
-    prog.status = "starting"
-    prog.cookie_file = cookie_file_path
+# --- Job Coalescing ---
+inflight_jobs = {}  # request key -> job id
+completed_artifacts = {}  # (extractor, media id, media, quality) -> file path
+artifact_aliases = {}  # request key -> artifact key
+coalesce_lock = threading.Lock()
 
-    # Check platform requirements
-    platform_info = check_platform_requirements(url)
-    log.info(f"Platform check: {platform_info['message']}")
 
-    # Small random delay to stagger repeated requests
-    time.sleep(random.uniform(0.2, 0.9))
+def download_request_key(url: str, media: str, quality: str, cookie_file_path=None):
+    """Requests with the same key produce byte-identical output and can share one job"""
+    return normalize_url(url), cookie_identity(cookie_file_path), media, quality
+
+
+def artifact_key(info: dict, media: str, quality: str):
+    return info.get("extractor_key") or info.get("extractor"), info.get("id"), media, quality
 
+
+def lookup_artifact(key):
+    """Path of a finished artifact that is still on disk, or None"""
+    with coalesce_lock:
+        path = completed_artifacts.get(key)
+        if path and not os.path.exists(path):
+            del completed_artifacts[key]
+            path = None
+    return path
+
+
+def lookup_artifact_for_request(request_key):
+    with coalesce_lock:
+        key = artifact_aliases.get(request_key)
+    return lookup_artifact(key) if key else None
+
+
+def record_artifact(request_key, key, path: str):
+    with coalesce_lock:
+        completed_artifacts[key] = path
+        if request_key:
+            artifact_aliases[request_key] = key
+
+
+def attach_to_job(session_id: str, job_id: str):
+    job_prog = download_sessions[job_id]
+    job_prog.subscribers.append(session_id)
+    download_sessions[session_id].job_id = job_id
+
+
+def detach_from_job(session_id: str):
+    """Remove a client session from its job; returns the job if nobody else is waiting on it"""
+    prog = download_sessions.get(session_id)
+    job_prog = download_sessions.get(prog.job_id) if prog and prog.job_id else None
+    if not job_prog:
+        return None
+    with coalesce_lock:
+        if session_id in job_prog.subscribers:
+            job_prog.subscribers.remove(session_id)
+        if job_prog.subscribers:
+            return None
+        if inflight_jobs.get(job_prog.request_key) == job_prog.session_id:
+            del inflight_jobs[job_prog.request_key]
+    return job_prog
+
+
+def queue_download(prog: DownloadProgress, owner, priority) -> bool:
+    """Attach a client session to the in-flight job for its request, or create and queue that job.
+
+    Returns True if an existing job was joined.
+    """
+    request_key = download_request_key(prog.url, prog.media, prog.quality, prog.cookie_file)
+    with coalesce_lock:
+        job_id = inflight_jobs.get(request_key)
+        joined = job_id is not None
+        if not joined:
+            job_id = str(uuid.uuid4())
+            job_prog = DownloadProgress(job_id)
+            job_prog.request_key = request_key
+            job_prog.url, job_prog.media, job_prog.quality = prog.url, prog.media, prog.quality
+            job_prog.cookie_file = prog.cookie_file
+            job_prog.user_id = prog.user_id
+            job_prog.owner = owner
+            job_prog.priority = priority
+            download_sessions[job_id] = job_prog
+            inflight_jobs[request_key] = job_id
+        attach_to_job(prog.session_id, job_id)
+
+    if joined:
+        persist_progress(prog)
+        return True
+
+    # Job row first, so a restart never finds a session pointing at a job it does not know
+    persist_progress(job_prog, prog)
+    download_scheduler.submit(DownloadJob(job_id, prog.url, prog.media, prog.quality, prog.cookie_file,
+                                          user_id=prog.user_id, owner=owner, priority=priority))
+    return False
+
+
+# --- Cancellation ---
+class JobCancelled(yt_dlp.utils.DownloadCancelled):
+    msg = "Download cancelled"
+
+
+# Temp and intermediate files yt-dlp leaves next to <base>: .mp4.part, .f137.mp4, .f137.mp4.part-Frag3, .temp.mp4,
+# .mp4.ytdl. Every alternative needs one of those markers, so a finished <base>.mp4 never matches.
+_PARTIAL_SUFFIX = r'(\.part(-Frag\d+)?|\.ytdl)'
+PARTIAL_FILE_RE = re.compile(rf'^(f[\w-]+\.(temp\.)?\w+{_PARTIAL_SUFFIX}?'
+                             rf'|temp\.\w+{_PARTIAL_SUFFIX}?'
+                             rf'|\w+{_PARTIAL_SUFFIX})$')
+
+job_context = threading.local()
+cancellation_stats = {"cancelled_jobs": 0, "bytes_saved": 0, "processes_terminated": 0, "files_removed": 0}
+cancellation_lock = threading.Lock()
+
+_popen_init = yt_dlp.utils.Popen.__init__
+
+
+def _tracked_popen_init(self, *args, **kwargs):
+    """Remember ffmpeg/ffprobe processes started for a download job so cancel can kill them"""
+    _popen_init(self, *args, **kwargs)
+    processes = getattr(job_context, "processes", None)
+    if processes is not None:
+        processes.append(self)
+
+
+yt_dlp.utils.Popen.__init__ = _tracked_popen_init
+
+
+def check_cancelled(prog: DownloadProgress):
+    if prog.cancel_event.is_set():
+        raise JobCancelled()
+
+
+def request_cancel(prog: DownloadProgress):
+    """Abort a running job: hooks raise on their next call and child processes are terminated now"""
+    prog.cancel_event.set()
+    terminated = 0
+    for proc in list(prog.processes):
+        if proc.poll() is None:
+            proc.terminate()
+            terminated += 1
+    with cancellation_lock:
+        cancellation_stats["processes_terminated"] += terminated
+
+
+def remove_partial_files(base: str, session_id: str) -> int:
+    """Delete temp/intermediate files of an aborted download.
+
+    Finished artifacts are kept, and so is everything under the base while
+    another running job writes to it (same media requested with different
+    cookies is not merged into one job).
+    """
+    if any(p.output_base == base and p.session_id != session_id and p.status not in FINAL_STATUSES
+           for p in list(download_sessions.values())):
+        return 0
+    directory, prefix = os.path.split(base)
+    with coalesce_lock:
+        keep = set(completed_artifacts.values())
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.startswith(prefix + "."):
+            continue
+        path = os.path.join(directory, name)
+        if path in keep or not PARTIAL_FILE_RE.match(name[len(prefix) + 1:]):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            log.warning(f"Could not remove partial file {name}: {e}")
+    return removed
+
+
+def finish_cancelled(prog: DownloadProgress):
+    with coalesce_lock:
+        prog.status = "cancelled"
+        inflight_jobs.pop(prog.request_key, None)
+    persist_progress(prog)
+    for proc in list(prog.processes):
+        if proc.poll() is None:
+            proc.kill()
+    removed = remove_partial_files(prog.output_base, prog.session_id) if prog.output_base else 0
+    saved = max((prog.total_bytes or 0) - (prog.downloaded_bytes or 0), 0)
+    with cancellation_lock:
+        cancellation_stats["cancelled_jobs"] += 1
+        cancellation_stats["bytes_saved"] += saved
+        cancellation_stats["files_removed"] += removed
+    log.info(f"Job {prog.session_id} cancelled; {fmt_bytes(saved)} not downloaded, {removed} partial files removed")
+
+
+# --- Job Timing ---
+class JobTimer:
+    """Wall-clock seconds a job spent in each phase (extract, download, postprocess)"""
+
+    def __init__(self):
+        self.phases = {}
+        self._started = {}
+
+    def start(self, phase: str):
+        self._started[phase] = time.monotonic()
+
+    def stop(self, phase: str):
+        began = self._started.pop(phase, None)
+        if began is not None:
+            self.phases[phase] = self.phases.get(phase, 0.0) + time.monotonic() - began
+
+    def as_dict(self) -> dict:
+        return {phase: round(seconds, 2) for phase, seconds in self.phases.items()}
+
+
+job_timings = {}  # "media/quality" -> totals over finished jobs
+job_timings_lock = threading.Lock()
+
+
+def postprocessor_hook(d, prog: DownloadProgress):
+    # Stop between postprocessing steps too; a running ffmpeg is killed by request_cancel
+    check_cancelled(prog)
+    if d.get("status") == "started":
+        prog.timer.start("postprocess")
+    elif d.get("status") == "finished":
+        prog.timer.stop("postprocess")
+
+
+def record_job_timing(prog: DownloadProgress, media: str, quality: str):
+    timer = prog.timer
+    # Postprocessors run inside process_ie_result, so take them out of the download phase
+    if "download" in timer.phases:
+        timer.phases["download"] = max(timer.phases["download"] - timer.phases.get("postprocess", 0.0), 0.0)
+    timer.phases["total"] = time.time() - prog.created_at
+    log.info(f"Job {prog.session_id} ({media}/{quality}) timings: {timer.as_dict()}")
+    with job_timings_lock:
+        totals = job_timings.setdefault(f"{media}/{quality}", {"jobs": 0})
+        totals["jobs"] += 1
+        for phase, seconds in timer.phases.items():
+            totals[phase] = totals.get(phase, 0.0) + seconds
+
+
+def job_timing_stats() -> dict:
+    """Average seconds per phase for each media/quality combination"""
+    with job_timings_lock:
+        return {
+            key: {"jobs": totals["jobs"],
+                  **{phase: round(seconds / totals["jobs"], 2)
+                     for phase, seconds in totals.items() if phase != "jobs"}}
+            for key, totals in job_timings.items()
+        }
+
+
+# --- Adaptive Fragment Concurrency ---
+FRAGMENT_CONCURRENCY_MIN = 1
+FRAGMENT_CONCURRENCY_MAX = 16
+FRAGMENT_GLOBAL_BUDGET = 48  # fragment connections shared by all running jobs
+FRAGMENT_ERROR_RATE_LIMIT = 0.05  # retried fragments per fragment above which a host backs off
+FRAGMENT_EWMA_WEIGHT = 0.3
+
+
+class HostFragmentStats:
+    def __init__(self, concurrency: float):
+        self.concurrency = concurrency  # learned fragment parallelism
+        self.throughput = None  # EWMA bytes/s of fragmented downloads
+        self.error_rate = 0.0  # EWMA retried fragments per fragment
+        self.samples = 0
+        self.throttled = 0
+
+
+class FragmentController:
+    """Learns per-host fragment parallelism for HLS/DASH downloads.
+
+    Each finished fragmented download is a sample. A 429 halves the host's
+    concurrency, a high retry rate lowers it by one, and a clean sample run
+    at the learned level raises it by one while throughput keeps up.
+    Jobs get the learned value capped by an equal share of
+    FRAGMENT_GLOBAL_BUDGET, so a busy box uses fewer connections per job.
+    """
+
+    def __init__(self, budget=FRAGMENT_GLOBAL_BUDGET):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._hosts = {}  # host -> HostFragmentStats
+        self._jobs = {}  # session id -> per-job state
+
+    def allocate(self, session_id: str, host: str, initial: int) -> int:
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats is None:
+                stats = self._hosts[host] = HostFragmentStats(initial)
+            job = self._jobs.setdefault(session_id, {"host": host, "allocated": 0, "fragments": 0,
+                                                      "errors": 0, "throttled": False})
+            share = self.budget // len(self._jobs)
+            job["allocated"] = max(FRAGMENT_CONCURRENCY_MIN, min(round(stats.concurrency), share))
+            return job["allocated"]
+
+    def release(self, session_id: str):
+        with self._lock:
+            self._jobs.pop(session_id, None)
+
+    def note_retry(self, session_id: str, message: str):
+        with self._lock:
+            job = self._jobs.get(session_id)
+            if job:
+                job["errors"] += 1
+                job["throttled"] = job["throttled"] or "429" in message
+
+    def observe(self, d: dict, session_id: str, opts: dict):
+        """Progress hook: collect fragment counts and learn from each finished fragmented download"""
+        status = d.get("status")
+        if status == "downloading" and d.get("fragment_count"):
+            with self._lock:
+                job = self._jobs.get(session_id)
+                if job:
+                    job["fragments"] = d["fragment_count"]
+        elif status == "finished":
+            with self._lock:
+                job = self._jobs.get(session_id)
+                if not job or not job["fragments"]:
+                    return
+                sample = dict(job)
+                job.update(fragments=0, errors=0, throttled=False)
+            self._learn(sample, d.get("downloaded_bytes") or d.get("total_bytes") or 0, d.get("elapsed"))
+            # The next format of this job (e.g. the audio after the video) starts with the new value
+            opts["concurrent_fragment_downloads"] = self.allocate(session_id, sample["host"],
+                                                                  sample["allocated"])
+
+    def _learn(self, sample: dict, size: int, elapsed):
+        throughput = size / elapsed if elapsed else None
+        error_rate = sample["errors"] / max(sample["fragments"], 1)
+        with self._lock:
+            stats = self._hosts[sample["host"]]
+            stats.samples += 1
+            stats.error_rate += FRAGMENT_EWMA_WEIGHT * (error_rate - stats.error_rate)
+            if sample["throttled"]:
+                stats.throttled += 1
+                stats.concurrency = max(FRAGMENT_CONCURRENCY_MIN, stats.concurrency / 2)
+            elif error_rate > FRAGMENT_ERROR_RATE_LIMIT:
+                stats.concurrency = max(FRAGMENT_CONCURRENCY_MIN, stats.concurrency - 1)
+            elif throughput and sample["allocated"] >= int(stats.concurrency):
+                # Only samples that actually ran at the learned level say whether more helps
+                if stats.throughput is None or throughput >= stats.throughput * 0.9:
+                    stats.concurrency = min(FRAGMENT_CONCURRENCY_MAX, stats.concurrency + 1)
+                elif throughput < stats.throughput * 0.75:
+                    stats.concurrency = max(FRAGMENT_CONCURRENCY_MIN, stats.concurrency - 1)
+            if throughput:
+                stats.throughput = throughput if stats.throughput is None else \
+                    stats.throughput + FRAGMENT_EWMA_WEIGHT * (throughput - stats.throughput)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "active_jobs": {sid: job["allocated"] for sid, job in self._jobs.items()},
+                "hosts": {
+                    host: {
+                        "concurrency": round(st.concurrency, 1),
+                        "throughput": round(st.throughput) if st.throughput else None,
+                        "error_rate": round(st.error_rate, 3),
+                        "samples": st.samples,
+                        "throttled": st.throttled,
+                    }
+                    for host, st in self._hosts.items()
+                },
+            }
+
+
+fragment_controller = FragmentController()
+
+
+class JobLogger:
+    """yt-dlp logger for a job: reports fragment retries through the job channel instead of printing them"""
+
+    def __init__(self, session_id: str, channel):
+        self.session_id = session_id
+        self.channel = channel
+
+    def debug(self, msg: str):
+        # yt-dlp routes to_screen output here, including "[download] Got error: ... Retrying fragment N"
+        if msg.startswith("[download] Got error:") and "fragment" in msg:
+            self.channel.retry(msg)
+
+    def info(self, msg: str):
+        pass
+
+    def warning(self, msg: str):
+        log.debug(f"yt-dlp [{self.session_id}]: {msg}")
+
+    def error(self, msg: str):
+        log.debug(f"yt-dlp [{self.session_id}]: {msg}")
+
+
+def build_outtmpl(media: str, quality: str) -> str:
+    # Different qualities of the same media must not share a file: two jobs writing one .part
+    # (or one extracting audio from a source the other still reads) corrupt each other
+    variant = f".{quality}" if media in ("video", "audio") and quality != "best" else ""
+    return os.path.join(DOWNLOAD_DIR, f"%(title).150B-%(id)s{variant}.%(ext)s")
+
+
+def build_download_opts(url, media: str, quality: str, cookie_file_path=None) -> dict:
     opts = ydl_base_opts(cookie_file_path, url)
     if media == "audio":
-        opts |= build_audio_opts()
+        opts |= build_audio_opts(quality)
     elif media == "photo":
         opts |= build_photo_opts()
     else:
-        opts |= {"format": build_video_format(quality)}
+        opts |= build_video_opts(quality)
+    opts["outtmpl"] = {"default": build_outtmpl(media, quality)}
+    return opts
+
+
+# --- Download Engine ---
+DOWNLOAD_ENGINE = os.environ.get('DOWNLOAD_ENGINE', 'thread')  # 'process' or 'thread'
+WORKER_MAX_JOBS = 50  # jobs a worker process runs before it is replaced
+WORKER_MAX_RSS = 768 * 1024 ** 2  # resident bytes after which a worker is replaced
+WORKER_CANCEL_GRACE = 2.0  # seconds a cancelled job gets to stop at a hook before its worker is killed
+WORKER_POLL_INTERVAL = 0.5
+
+# Progress hook fields the web process uses; the rest of the dict stays with yt-dlp
+PROGRESS_FIELDS = ("status", "filename", "downloaded_bytes", "total_bytes", "total_bytes_estimate",
+                   "speed", "eta", "elapsed", "fragment_index", "fragment_count")
+
+
+class JobChannel:
+    """Web-process side of a running job: fetch_media reports through it and it updates the session.
+
+    The thread engine calls it directly. For the process engine it
+    handles the worker's messages and answers the calls the worker waits
+    on, so cancellation, bandwidth throttling and fragment concurrency
+    behave the same in both.
+    """
+
+    def __init__(self, prog: DownloadProgress, media: str, quality: str, cache_key):
+        self.prog = prog
+        self.media = media
+        self.quality = quality
+        self.cache_key = cache_key
+        self.artifact_key = None
+
+    def progress(self, d: dict):
+        """Returns option updates for the rest of the job, e.g. a new fragment concurrency"""
+        updates = {}
+        progress_hook(d, self.prog.session_id)
+        fragment_controller.observe(d, self.prog.session_id, updates)
+        bandwidth_manager.observe(d, self.prog.session_id, self.prog.cancel_event)
+        return updates or None
+
+    def postprocess(self, status: str):
+        postprocessor_hook({"status": status}, self.prog)
+
+    def check(self):
+        check_cancelled(self.prog)
+
+    def start_phase(self, phase: str):
+        self.prog.timer.start(phase)
+
+    def stop_phase(self, phase: str):
+        self.prog.timer.stop(phase)
+
+    def extracted(self, info: dict):
+        metadata_cache.put(self.cache_key, info)
+
+    def invalidate_info(self):
+        metadata_cache.invalidate(self.cache_key)
+
+    def artifact(self, key, output_base: str):
+        """Note where the job writes and return an existing file of the same media, if any"""
+        self.prog.output_base = output_base
+        self.artifact_key = key
+        return lookup_artifact(key)
+
+    def retry(self, msg: str):
+        fragment_controller.note_retry(self.prog.session_id, msg)
+
+
+def fetch_media(spec: dict, channel) -> list:
+    """Extract and download one job with yt-dlp and return the paths of the finished files.
+
+    Runs on a scheduler thread or inside a worker process; it only talks
+    to the session through channel.
+    """
+    url, media, quality = spec["url"], spec["media"], spec["quality"]
+    opts = build_download_opts(url, media, quality, spec["cookie_file"])
+    opts["concurrent_fragment_downloads"] = spec["concurrent_fragment_downloads"]
+    opts["logger"] = JobLogger(spec["session_id"], channel)
+    # ydl is bound by the with statement below before any hook runs
+    opts["progress_hooks"] = [lambda d: ydl.params.update(
+        channel.progress({k: d[k] for k in PROGRESS_FIELDS if k in d}) or {})]
+    # Final path of every file, after merging/conversion; a carousel yields several
+    files = []
+    opts["post_hooks"] = [files.append]
+    opts["postprocessor_hooks"] = [lambda d: channel.postprocess(d.get("status"))]
+
+    with ydl_pool.lease(opts) as ydl:
+        # Reuse the info fetched by /get_video_info instead of a second extractor round trip
+        info = spec["info"]
+        from_cache = info is not None
+        if not from_cache:
+            channel.start_phase("extract")
+            info = MetadataCache.sanitize(ydl.extract_info(url, download=False))
+            channel.stop_phase("extract")
+            channel.extracted(info)
+
+        channel.check()
+        existing = channel.artifact(artifact_key(info, media, quality),
+                                    os.path.splitext(ydl.prepare_filename(info))[0])
+        if existing:
+            log.info(f"Serving existing artifact for {url}: {existing}")
+            return [existing]
+
+        channel.start_phase("download")
+        try:
+            info = ydl.process_ie_result(info, download=True)
+        except yt_dlp.utils.DownloadError as e:
+            if not from_cache:
+                raise
+            log.info(f"Cached info unusable for {url}, re-extracting: {e}")
+            channel.invalidate_info()
+            info = ydl.extract_info(url, download=True)
+            channel.extracted(MetadataCache.sanitize(info))
+        channel.stop_phase("download")
+
+        files = [p for p in dict.fromkeys(files) if os.path.exists(p)]
+        if files:
+            # Paths reported by yt-dlp after postprocessing; a multi-item post has several
+            return files
+
+        # Path resolution - updated for photos
+        target = ydl.prepare_filename(info)
+        base, ext = os.path.splitext(target)
+
+        candidates = [
+            target,
+            f"{base}.mp4",
+            f"{base}.mkv",
+            f"{base}.webm",
+            f"{base}.m4a",
+            f"{base}.opus",
+            f"{base}.ogg",
+            f"{base}.mp3",
+            f"{base}.jpg",
+            f"{base}.jpeg",
+            f"{base}.png",
+            f"{base}.gif",
+            f"{base}.webp"
+        ]
+        for p in candidates:
+            if os.path.exists(p):
+                return [p]
+        raise FileNotFoundError("Downloaded file not found.")
+
+
+class ThreadEngine:
+    """Runs fetch_media on the scheduler thread itself"""
+
+    def prepare(self):
+        pass
+
+    def run(self, spec: dict, channel: JobChannel) -> list:
+        return fetch_media(spec, channel)
+
+    def stats(self) -> dict:
+        return {"engine": "thread"}
+
+
+class WorkerError(Exception):
+    """A job failed inside a worker process; the message is the worker's error"""
+
 
-    opts["progress_hooks"] = [lambda d: progress_hook(d, session_id)]
+class PipeChannel:
+    """Worker side of a JobChannel: forwards every call to the web process over the pipe"""
 
+    # Sent without waiting for an answer
+    NOTIFICATIONS = {"extracted", "invalidate_info", "retry", "start_phase", "stop_phase"}
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.Lock()  # fragment threads report progress concurrently
+
+    def __getattr__(self, name):
+        if name in self.NOTIFICATIONS:
+            return lambda *args: self._send(("notify", name, args))
+        return lambda *args: self._call(name, args)
+
+    def _send(self, msg):
+        with self._lock:
+            self.conn.send(msg)
+
+    def _call(self, name: str, args):
+        with self._lock:
+            self.conn.send(("call", name, args))
+            status, result = self.conn.recv()
+        if status == "cancelled":
+            raise JobCancelled()
+        if status == "error":
+            raise WorkerError(result)
+        return result
+
+
+def process_rss() -> int:
+    """Resident bytes of this process, 0 where /proc is not available"""
     try:
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            info = ydl.extract_info(url, download=True)
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class WorkerJob:
+    """The job a worker process is running and the ffmpeg/ffprobe children it started"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.session_id = None
+        self.processes = []
+        self.terminated = 0
+
+    def begin(self, session_id: str):
+        with self._lock:
+            self.session_id = session_id
+            self.processes = job_context.processes = []
+            self.terminated = 0
+
+    def end(self) -> int:
+        """Forget the finished job and return how many of its children a cancel terminated"""
+        with self._lock:
+            self.session_id = None
+            self.processes = job_context.processes = []
+            return self.terminated
+
+    def cancel(self, session_id: str):
+        """Terminate the job's children; hooks are not called while ffmpeg merges or converts"""
+        with self._lock:
+            if session_id != self.session_id:
+                return  # arrived after that job ended
+            processes = list(self.processes)
+        terminated = 0
+        for proc in processes:
+            if proc.poll() is None:
+                proc.terminate()
+                terminated += 1
+        with self._lock:
+            self.terminated += terminated
+
+    def listen(self, cancel_conn):
+        while True:
+            try:
+                self.cancel(cancel_conn.recv())
+            except (EOFError, OSError):
+                return
+
+
+def worker_main(conn, cancel_conn):
+    """Entry point of a worker process: run the jobs sent over conn until it is closed or sent None.
+
+    cancel_conn carries the session ids of jobs the web process cancelled.
+    """
+    if hasattr(os, "setsid"):
+        # Own process group, so killing a stuck worker takes its ffmpeg children with it
+        os.setsid()
+    job = WorkerJob()
+    threading.Thread(target=job.listen, args=(cancel_conn,), name="cancel-listener", daemon=True).start()
+    channel = PipeChannel(conn)
+    while True:
+        try:
+            spec = conn.recv()
+        except (EOFError, OSError):
+            return
+        if spec is None:
+            return
+        job.begin(spec["session_id"])
+        try:
+            kind, payload = "done", fetch_media(spec, channel)
+        except Exception as e:
+            kind, payload = "failed", str(e)
+        try:
+            conn.send((kind, payload, {"rss": process_rss(), "terminated": job.end()}))
+        except OSError:
+            return  # web process is gone
+
+
+class WorkerProcess:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        child_cancel, self.cancel_conn = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(target=worker_main, args=(child_conn, child_cancel), daemon=True)
+        self.process.start()
+        child_conn.close()
+        child_cancel.close()
+        self.jobs = 0
+        self.rss = 0
+        self.killed = False
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def run(self, spec: dict, channel: JobChannel) -> list:
+        self.jobs += 1
+        self.conn.send(spec)
+        cancelled_at = None
+        while True:
+            if channel.prog.cancel_event.is_set():
+                if cancelled_at is None:
+                    # The next hook call answers "cancelled"; the worker stops ffmpeg, which makes no hook calls
+                    cancelled_at = time.monotonic()
+                    try:
+                        self.cancel_conn.send(spec["session_id"])
+                    except OSError:
+                        pass  # worker already gone; the liveness check below reports it
+                elif time.monotonic() - cancelled_at > WORKER_CANCEL_GRACE:
+                    # Last resort for a worker stuck outside both yt-dlp's hooks and its children
+                    self.kill()
+                    raise JobCancelled()
+            if not self.conn.poll(WORKER_POLL_INTERVAL):
+                if not self.process.is_alive():
+                    raise WorkerError("Download worker exited unexpectedly")
+                continue
+            try:
+                kind, payload, extra = self.conn.recv()
+            except EOFError:
+                raise WorkerError("Download worker exited unexpectedly")
+            if kind in ("done", "failed"):
+                self.rss = extra["rss"]
+                if extra["terminated"]:
+                    with cancellation_lock:
+                        cancellation_stats["processes_terminated"] += extra["terminated"]
+                if kind == "failed":
+                    raise WorkerError(payload)
+                return payload
+            try:
+                reply = ("ok", getattr(channel, payload)(*extra))
+            except JobCancelled:
+                reply = ("cancelled", None)
+            except Exception as e:
+                log.error(f"Job channel {payload} failed for {channel.prog.session_id}: {e}")
+                reply = ("error", str(e))
+            if kind == "call":
+                self.conn.send(reply)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+        self.cancel_conn.close()
+
+    def kill(self):
+        self.killed = True
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            # No process groups here, or the worker has not called setsid yet
+            self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+        self.cancel_conn.close()
+
+
+class ProcessEngine:
+    """Runs fetch_media in worker processes, one per scheduler thread.
+
+    yt-dlp, its extractors and ffmpeg orchestration live in the worker, so
+    they neither hold the web process's GIL nor grow its memory; the web
+    process keeps only the session state that JobChannel updates. A
+    worker is replaced after WORKER_MAX_JOBS jobs or once its resident
+    memory passes WORKER_MAX_RSS.
+    """
+
+    def __init__(self):
+        self._ctx = multiprocessing.get_context("spawn")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._workers = {}  # scheduler thread name -> WorkerProcess
+        self.started = 0
+        self.recycled = 0
+        self.killed = 0
+
+    def prepare(self):
+        """Start this thread's worker before its first job so its import is not on the clock"""
+        self._worker()
+
+    def run(self, spec: dict, channel: JobChannel) -> list:
+        worker = self._worker()
+        try:
+            return worker.run(spec, channel)
+        finally:
+            if worker.killed:
+                with self._lock:
+                    self.killed += 1
+                self._local.worker = None
+            elif worker.jobs >= WORKER_MAX_JOBS or worker.rss > WORKER_MAX_RSS:
+                log.info(f"Recycling download worker {worker.process.pid} after {worker.jobs} jobs, "
+                         f"{fmt_bytes(worker.rss)} resident")
+                worker.stop()
+                with self._lock:
+                    self.recycled += 1
+                self._local.worker = None
+            if self._local.worker is None:
+                try:
+                    self._worker()  # replacement starts before the next job arrives
+                except Exception as e:
+                    log.error(f"Could not replace download worker: {e}")
+
+    def _worker(self) -> WorkerProcess:
+        worker = getattr(self._local, "worker", None)
+        if worker is None or not worker.alive():
+            worker = self._local.worker = WorkerProcess(self._ctx)
+            with self._lock:
+                self.started += 1
+                self._workers[threading.current_thread().name] = worker
+        return worker
+
+    def stats(self) -> dict:
+        with self._lock:
+            workers = list(self._workers.values())
+            started, recycled, killed = self.started, self.recycled, self.killed
+        return {
+            "engine": "process",
+            "started": started,
+            "recycled": recycled,
+            "killed": killed,
+            "workers": [{"pid": w.process.pid, "alive": w.alive(), "jobs": w.jobs, "rss": w.rss}
+                        for w in workers],
+        }
 
-            # Path resolution - updated for photos
-            target = ydl.prepare_filename(info)
-            base, ext = os.path.splitext(target)
-
-            candidates = [
-                target,
-                f"{base}.mp4",
-                f"{base}.mkv",
-                f"{base}.webm",
-                f"{base}.m4a",
-                f"{base}.mp3",
-                f"{base}.jpg",
-                f"{base}.jpeg",
-                f"{base}.png",
-                f"{base}.gif",
-                f"{base}.webp"
-            ]
-            for p in candidates:
-                if os.path.exists(p):
-                    prog.filepath = p
-                    prog.filename = os.path.basename(p)
-                    break
 
-            if not prog.filepath:
-                raise FileNotFoundError("Downloaded file not found.")
+download_engine = ProcessEngine() if DOWNLOAD_ENGINE == "process" else ThreadEngine()
+
+
+def download_job(url: str, media: str, quality: str, session_id: str, cookie_file_path=None):
+    prog = download_sessions[session_id]
+    job_context.processes = prog.processes
+    try:
+        _run_download(prog, url, media, quality, cookie_file_path)
+    finally:
+        job_context.processes = None
+        prog.processes.clear()
+        fragment_controller.release(session_id)
+        bandwidth_manager.release(session_id)
+
+
+def _run_download(prog: DownloadProgress, url: str, media: str, quality: str, cookie_file_path=None):
+    session_id = prog.session_id
+    prog.status = "starting"
+    prog.timer = JobTimer()
+    prog.timer.phases["queue"] = time.time() - prog.created_at
+    prog.cookie_file = cookie_file_path
+    prog.queue_position = None
+    prog.queue_eta = None
+    emit_progress(prog)
+
+    # Check platform requirements
+    platform_info = check_platform_requirements(url)
+    log.info(f"Platform check: {platform_info['message']}")
+
+    # Small random delay to stagger repeated requests
+    time.sleep(random.uniform(0.2, 0.9))
+
+    platform = get_platform_key(url)
+    spec = {
+        "session_id": session_id,
+        "url": url,
+        "media": media,
+        "quality": quality,
+        "cookie_file": cookie_file_path,
+        "concurrent_fragment_downloads": fragment_controller.allocate(
+            session_id, platform or "", platform_registry.tunable(platform, "concurrent_fragment_downloads") or 1),
+    }
+    bandwidth_manager.register(session_id, prog.owner, platform or "", prog.priority)
+    channel = JobChannel(prog, media, quality, MetadataCache.key(url, cookie_file_path))
+    prog.files = []
 
+    try:
+        spec["info"] = metadata_cache.get(channel.cache_key)
+        prog.files = download_engine.run(spec, channel)
+        prog.filepath = prog.files[0]
+        prog.filename = os.path.basename(prog.filepath)
+        if len(prog.files) == 1:
+            # The artifact index maps to one path, so multi-file results are not shared
+            record_artifact(prog.request_key, channel.artifact_key, prog.filepath)
+            prog.artifact = channel.artifact_key
+        retention_manager.request_sweep()
+        record_job_timing(prog, media, quality)
+        with coalesce_lock:
             prog.status = "completed"
+            prog.progress = 100.0
+            inflight_jobs.pop(prog.request_key, None)
 
+        targets = fan_out(prog)
+        persist_progress(prog, *targets)
+        for target in targets:
             # Log successful download for logged-in users
-            if 'user_id' in session and session['user_id']:
-                log_user_activity(session['user_id'], 'download_completed',
+            if target.user_id:
+                log_user_activity(target.user_id, 'download_completed',
                                   url=url, format=media, quality=quality,
-                                  filename=prog.filename, status='completed')
+                                  filename=target.filename, status='completed')
 
             socketio.emit("download_complete", {
-                "session_id": session_id,
-                "filename": prog.filename
-            })
+                "session_id": target.session_id,
+                "filename": target.filename,
+                "files_count": len(target.files)
+            }, to=target.session_id)
+        batch_items_finished(targets)
 
     except Exception as e:
-        prog.status = "error"
+        if prog.cancel_event.is_set():
+            finish_cancelled(prog)
+            return
+        with coalesce_lock:
+            prog.status = "error"
+            inflight_jobs.pop(prog.request_key, None)
         err = str(e)
+        if is_permanent_extraction_error(err):
+            metadata_cache.put_error(MetadataCache.key(url, cookie_file_path), err)
 
         # Platform-specific error handling
         platform_config = get_platform_config(url)
@@ -652,13 +2822,1246 @@ def download_job(url: str, media: str, quality: str, session_id: str, cookie_fil
             else:
                 prog.error = f"Download failed: {err}"
 
-        # Log failed download for logged-in users
-        if 'user_id' in session and session['user_id']:
-            log_user_activity(session['user_id'], 'download_failed',
-                              url=url, format=media, quality=quality,
-                              status='failed')
+        targets = fan_out(prog)
+        persist_progress(prog, *targets)
+        for target in targets:
+            # Log failed download for logged-in users
+            if target.user_id:
+                log_user_activity(target.user_id, 'download_failed',
+                                  url=url, format=media, quality=quality,
+                                  status='failed')
+
+            socketio.emit("download_error", {"session_id": target.session_id, "error": target.error},
+                          to=target.session_id)
+        batch_items_finished(targets)
+
+
+# --- Stream-through Downloads ---
+STREAM_MAX_CONCURRENT = 8
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_READY_TIMEOUT = 60  # seconds the client has to open the stream URL
+STREAM_PROTOCOLS = ('http', 'https')
+
+stream_slots = threading.BoundedSemaphore(STREAM_MAX_CONCURRENT)
+stream_lock = threading.Lock()
+
+
+def plan_stream(url: str, media: str, quality: str, cookie_file_path=None):
+    """Pick the format a staged download would use and return it if it can be piped as-is.
+
+    Returns None when the result needs a merge (separate video and audio),
+    a transcode (MP3 audio) or a fragmented protocol such as HLS/DASH;
+    those go through the staged path. Native audio is sent in the origin's
+    container.
+    """
+    if media == "audio" and quality == "mp3":
+        return None
+
+    info = metadata_cache.get(MetadataCache.key(url, cookie_file_path))
+    if info is None:
+        info = extract_info_only(url, cookie_file_path)
+        info = metadata_cache.get(MetadataCache.key(url, cookie_file_path)) or info
+
+    opts = ydl_base_opts(cookie_file_path, url) | {"skip_download": True}
+    if media == "audio":
+        opts["format"] = build_audio_opts(quality)["format"]
+    else:
+        opts |= build_photo_opts() if media == "photo" else build_video_opts(quality)
+    opts["outtmpl"] = {"default": build_outtmpl(media, quality)}
+    with ydl_pool.lease(opts) as ydl:
+        selected = ydl.process_ie_result(info, download=False)
+        filename = os.path.basename(ydl.prepare_filename(selected))
+
+    if selected.get("requested_formats") or selected.get("protocol") not in STREAM_PROTOCOLS:
+        return None
+    if not selected.get("url"):
+        return None
+    return {
+        "url": selected["url"],
+        "http_headers": selected.get("http_headers") or {},
+        "filename": filename,
+        "filesize": selected.get("filesize"),
+        "chunk_size": (selected.get("downloader_options") or {}).get("http_chunk_size"),
+    }
+
+
+def expire_stream(session_id: str):
+    """Give back the slot of a stream the client never opened"""
+    prog = download_sessions.get(session_id)
+    with stream_lock:
+        if not prog or prog.status != "ready":
+            return
+        prog.status = "expired"
+    stream_slots.release()
+
+
+def open_origin(ydl, fmt: dict, start: int, end=None):
+    headers = dict(fmt["http_headers"])
+    if end is not None:
+        headers["Range"] = f"bytes={start}-{end}"
+    return ydl.urlopen(yt_dlp.networking.Request(fmt["url"], headers=headers))
+
+
+def iter_origin(ydl, fmt: dict):
+    """Yield the origin's bytes, using ranged requests where the extractor asks for them (e.g. YouTube throttling)"""
+    chunk_size = fmt.get("chunk_size")
+    total = fmt.get("filesize")
+    if not chunk_size or not total:
+        resp = open_origin(ydl, fmt, 0)
+        try:
+            while chunk := resp.read(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            resp.close()
+        return
+
+    for start in range(0, total, chunk_size):
+        resp = open_origin(ydl, fmt, start, min(start + chunk_size, total) - 1)
+        try:
+            if resp.status != 206 and start:
+                raise IOError("Origin stopped honouring range requests mid-stream")
+            while chunk := resp.read(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            resp.close()
+        if resp.status != 206:
+            # Origin ignored the Range header and sent the whole file
+            return
+
+
+def stream_generator(prog: DownloadProgress, ydl):
+    url = prog.url
+    started = time.monotonic()
+    try:
+        for chunk in iter_origin(ydl, prog.stream_format):
+            if prog.cancel_event.is_set():
+                return
+            bandwidth_manager.consume(prog.session_id, len(chunk), prog.cancel_event)
+            prog.downloaded_bytes += len(chunk)
+            elapsed = time.monotonic() - started
+            prog.speed = prog.downloaded_bytes / elapsed if elapsed > 0 else None
+            if prog.total_bytes:
+                prog.progress = prog.downloaded_bytes / prog.total_bytes * 100
+                prog.eta = int((prog.total_bytes - prog.downloaded_bytes) / prog.speed) if prog.speed else None
+            emit_progress(prog)
+            yield chunk
+
+        prog.status = "completed"
+        prog.progress = 100.0
+        emit_progress(prog)
+        if prog.user_id:
+            log_user_activity(prog.user_id, 'download_completed', url=url, filename=prog.filename,
+                              status='completed')
+        socketio.emit("download_complete", {"session_id": prog.session_id, "filename": prog.filename,
+                                            "streamed": True}, to=prog.session_id)
+    except GeneratorExit:
+        # Client went away mid-transfer
+        prog.status = "cancelled"
+        raise
+    except Exception as e:
+        log.error(f"Stream error for {prog.session_id}: {e}")
+        prog.status = "error"
+        prog.error = f"Download failed: {e}"
+        socketio.emit("download_error", {"session_id": prog.session_id, "error": prog.error},
+                      to=prog.session_id)
+
+
+# --- Retention ---
+DOWNLOAD_QUOTA_BYTES = 20 * 1024 ** 3
+DOWNLOAD_QUOTA_LOW_WATERMARK = 0.9  # evict down to this fraction of the quota
+ARTIFACT_MAX_AGE = 24 * 3600  # seconds since a file was last written or served
+SESSION_GRACE_PERIOD = 3600  # seconds a finished session stays downloadable
+RETENTION_SWEEP_INTERVAL = 300
+IN_PROGRESS_GRACE = 600  # files modified this recently may still be written by yt-dlp/ffmpeg
+FINAL_STATUSES = ("completed", "error", "cancelled", "expired")
+TEMP_SUFFIXES = (".part", ".ytdl", ".temp", ".tmp")
+
+
+class RetentionManager:
+    """Keeps DOWNLOAD_DIR under its byte quota and drops finished sessions after a grace period.
+
+    A file is never evicted while a live session points at it, while a
+    response is still sending it, or while it looks like a download in
+    progress (temp suffix or recently modified).
+    """
+
+    def __init__(self, quota_bytes=DOWNLOAD_QUOTA_BYTES, max_age=ARTIFACT_MAX_AGE,
+                 session_grace=SESSION_GRACE_PERIOD, interval=RETENTION_SWEEP_INTERVAL):
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.session_grace = session_grace
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._serving = {}  # path -> open responses
+        self._last_access = {}  # path -> last time it was served
+        self.usage_bytes = 0
+        self.file_count = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.expired_sessions = 0
+        self.last_sweep = None
+
+    def start(self):
+        """Start the sweeper thread; safe to call from every request, only the first call starts it"""
+        if self._thread:
+            return
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+            self._thread.start()
+
+    def request_sweep(self):
+        self._wake.set()
+
+    def acquire(self, path: str):
+        with self._lock:
+            self._serving[path] = self._serving.get(path, 0) + 1
+            self._last_access[path] = time.time()
+
+    def release(self, path: str):
+        with self._lock:
+            count = self._serving.get(path, 0) - 1
+            if count > 0:
+                self._serving[path] = count
+            else:
+                self._serving.pop(path, None)
+
+    def touch(self, path: str):
+        with self._lock:
+            self._last_access[path] = time.time()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "usage_bytes": self.usage_bytes,
+                "quota_bytes": self.quota_bytes,
+                "files": self.file_count,
+                "serving": sum(self._serving.values()),
+                "evicted_files": self.evicted_files,
+                "evicted_bytes": self.evicted_bytes,
+                "expired_sessions": self.expired_sessions,
+                "live_sessions": len(download_sessions),
+                "last_sweep": self.last_sweep,
+            }
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.sweep()
+            except Exception as e:
+                log.error(f"Retention sweep failed: {e}")
+
+    def sweep(self):
+        now = time.time()
+        self._expire_sessions(now)
+        protected = set()
+        for prog in list(download_sessions.values()):
+            protected.update(prog.files)
+            if prog.filepath:
+                protected.add(prog.filepath)
+
+        files = []
+        usage = 0
+        count = 0
+        with os.scandir(DOWNLOAD_DIR) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                usage += st.st_size
+                count += 1
+                with self._lock:
+                    last_used = max(st.st_mtime, self._last_access.get(entry.path, 0))
+                    busy = entry.path in self._serving
+                if (busy or entry.path in protected or entry.name.endswith(TEMP_SUFFIXES)
+                        or '.part-Frag' in entry.name or now - st.st_mtime < IN_PROGRESS_GRACE):
+                    continue
+                files.append((last_used, st.st_size, entry.path))
+
+        files.sort()
+        target = self.quota_bytes * DOWNLOAD_QUOTA_LOW_WATERMARK
+        over_quota = usage > self.quota_bytes
+        for last_used, size, path in files:
+            if now - last_used <= self.max_age and not (over_quota and usage > target):
+                continue
+            if self._evict(path, size):
+                usage -= size
+                count -= 1
+
+        with self._lock:
+            self.usage_bytes = usage
+            self.file_count = count
+            self.last_sweep = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def _expire_sessions(self, now: float):
+        expired = 0
+        for sid, prog in list(download_sessions.items()):
+            if prog.status not in FINAL_STATUSES:
+                continue
+            if prog.finished_at is None:
+                prog.finished_at = now
+            elif now - prog.finished_at > self.session_grace:
+                download_sessions.pop(sid, None)
+                batches.pop(sid, None)
+                forget_progress(sid)
+                expired += 1
+        with self._lock:
+            self.expired_sessions += expired
+
+    def _evict(self, path: str, size: int) -> bool:
+        try:
+            os.remove(path)
+        except OSError as e:
+            log.warning(f"Could not evict {path}: {e}")
+            return False
+        with coalesce_lock:
+            for key in [k for k, p in completed_artifacts.items() if p == path]:
+                del completed_artifacts[key]
+        with self._lock:
+            self._last_access.pop(path, None)
+            self.evicted_files += 1
+            self.evicted_bytes += size
+        log.info(f"Evicted {os.path.basename(path)} ({fmt_bytes(size)})")
+        return True
+
+
+retention_manager = RetentionManager()
+
+
+@app.before_request
+def start_retention():
+    # Also covers `flask run` and WSGI servers, which import the app without running __main__
+    if IS_DISPATCHER:
+        retention_manager.start()
+
+
+# --- Download Scheduler ---
+MAX_CONCURRENT_DOWNLOADS = 4
+DEFAULT_JOB_SECONDS = 60.0
+
+# Lower value is served first
+PRIORITY_ADMIN = 0
+PRIORITY_USER = 1
+PRIORITY_ANONYMOUS = 2
+
+
+class DownloadJob:
+    def __init__(self, session_id: str, url: str, media: str, quality: str,
+                 cookie_file_path=None, user_id=None, owner=None, priority=PRIORITY_ANONYMOUS):
+        self.session_id = session_id
+        self.url = url
+        self.media = media
+        self.quality = quality
+        self.cookie_file_path = cookie_file_path
+        self.user_id = user_id
+        # Fairness key: the logged-in user, or the client address for anonymous requests
+        self.owner = owner if owner is not None else user_id
+        self.priority = priority
+        self.platform = get_platform_key(url) or ""
+        self.enqueued_at = time.time()
+        self.sort_key = None
+
+
+class DownloadScheduler:
+    """Fixed-size worker pool fed by a priority queue.
+
+    Jobs are ordered by (priority, fairness round, arrival). Each owner's
+    jobs get consecutive rounds, so within a priority level owners are served
+    round-robin and each owner's own jobs stay FIFO. A job is only dispatched
+    while its platform is below its concurrency cap.
+    """
+
+    def __init__(self, workers=MAX_CONCURRENT_DOWNLOADS):
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._queue = []  # sorted list of (sort_key, job)
+        self._seq = itertools.count()
+        self._owner_round = {}
+        self._current_round = 0
+        self._active = {}  # platform -> running jobs
+        self._avg_job_seconds = DEFAULT_JOB_SECONDS
+        self._threads = []
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"download-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        log.info(f"Download scheduler started with {self.workers} workers")
+
+    @staticmethod
+    def platform_limit(platform: str) -> int:
+        return platform_registry.tunable(platform, 'max_concurrent')
+
+    def submit(self, job: DownloadJob):
+        self.start()
+        with self._cond:
+            # Owners get one slot per round; a new owner starts at the current round
+            rnd = max(self._owner_round.get(job.owner, self._current_round), self._current_round)
+            self._owner_round[job.owner] = rnd + 1
+            job.sort_key = (job.priority, rnd, next(self._seq))
+            bisect.insort(self._queue, (job.sort_key, job), key=lambda item: item[0])
+            self._cond.notify()
+        self._publish_positions()
+
+    def cancel(self, session_id: str) -> bool:
+        """Drop a job that has not started yet. Returns True if it was queued."""
+        with self._cond:
+            for i, (_, job) in enumerate(self._queue):
+                if job.session_id == session_id:
+                    del self._queue[i]
+                    break
+            else:
+                return False
+        self._publish_positions()
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "queued": len(self._queue),
+                "active": dict(self._active),
+                "avg_job_seconds": round(self._avg_job_seconds, 1),
+            }
+
+    def _next_runnable(self):
+        # Caller holds self._cond
+        for i, (_, job) in enumerate(self._queue):
+            if self._active.get(job.platform, 0) < self.platform_limit(job.platform):
+                del self._queue[i]
+                self._current_round = max(self._current_round, job.sort_key[1])
+                self._active[job.platform] = self._active.get(job.platform, 0) + 1
+                return job
+        return None
+
+    def _worker(self):
+        try:
+            download_engine.prepare()
+        except Exception as e:
+            log.error(f"Could not start download engine: {e}")
+        while True:
+            with self._cond:
+                job = self._next_runnable()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_runnable()
+            self._publish_positions()
+
+            started = time.time()
+            try:
+                prog = download_sessions.get(job.session_id)
+                if prog and prog.status != "cancelled":
+                    download_job(job.url, job.media, job.quality, job.session_id,
+                                 job.cookie_file_path)
+            except Exception as e:
+                log.error(f"Download worker error for {job.session_id}: {e}")
+            finally:
+                elapsed = time.time() - started
+                with self._cond:
+                    self._active[job.platform] -= 1
+                    if not self._active[job.platform]:
+                        del self._active[job.platform]
+                    self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * elapsed
+                    self._cond.notify_all()
+
+    def _publish_positions(self):
+        """Push queue position and a rough start ETA to every waiting job"""
+        with self._cond:
+            waiting = [job for _, job in self._queue]
+            avg = self._avg_job_seconds
+        for position, job in enumerate(waiting, start=1):
+            prog = download_sessions.get(job.session_id)
+            if not prog or prog.status != "queued":
+                continue
+            eta = int(((position - 1) // self.workers + 1) * avg)
+            if prog.queue_position == position and prog.queue_eta == eta:
+                continue
+            prog.queue_position = position
+            prog.queue_eta = eta
+            emit_progress(prog, force=True)
+
+
+download_scheduler = DownloadScheduler()
+
+
+# --- Bandwidth ---
+BANDWIDTH_BUDGET = int(os.environ.get('BANDWIDTH_BUDGET', 0))  # bytes/s shared by all transfers, 0 = unlimited
+BANDWIDTH_USER_CAP = int(os.environ.get('BANDWIDTH_USER_CAP', 0))  # bytes/s per owner, 0 = none
+BANDWIDTH_REBALANCE_INTERVAL = 2.0  # seconds between demand measurements
+BANDWIDTH_BURST = 0.5  # seconds of its rate a flow may receive in one go
+BANDWIDTH_MIN_RATE = 16 * 1024  # floor so no flow stalls outright
+BANDWIDTH_DEMAND_HEADROOM = 1.25  # room a flow gets above what it used last interval
+
+# Budget weight per scheduler priority
+BANDWIDTH_WEIGHTS = {PRIORITY_ADMIN: 4, PRIORITY_USER: 2, PRIORITY_ANONYMOUS: 1}
+
+
+class BandwidthFlow:
+    def __init__(self, owner, platform: str, weight: int):
+        self.owner = owner
+        self.platform = platform
+        self.weight = weight
+        self.active = False  # moved bytes since the last measurement
+        self.rate = None  # allocated bytes/s, None = unlimited
+        self.demand = None  # measured need when below its rate, None = takes all it gets
+        self.tokens = 0.0
+        self.refilled = time.monotonic()
+        self.bytes = 0
+        self.window_bytes = 0
+        self.waited = False  # slept on its bucket since the last measurement
+        self.last_file = None
+        self.last_bytes = 0
+
+
+class BandwidthManager:
+    """Shares a bytes/s budget between running downloads and streams.
+
+    Rates are weighted max-min fair: every active flow's rate rises in
+    proportion to its weight until the global budget, its owner's cap, its
+    platform's "bandwidth_cap" or its own measured demand is reached; flows
+    behind a full constraint stop there and the rest keep rising. Flows that
+    did not fill their rate over the last interval are held to what they
+    used plus headroom, so the spare goes to the others; a flow that has to
+    wait on its bucket gets its full share back at the next measurement.
+    Rates are recomputed when a flow starts moving bytes, ends, and every
+    BANDWIDTH_REBALANCE_INTERVAL, and each flow is held to its rate by a
+    token bucket charged from its progress hook.
+    """
+
+    def __init__(self, budget=BANDWIDTH_BUDGET, user_cap=BANDWIDTH_USER_CAP):
+        self.budget = budget or None
+        self.user_cap = user_cap or None
+        self._lock = threading.Lock()
+        self._flows = {}  # session id -> BandwidthFlow
+        self._measured = time.monotonic()
+        self.throttled_seconds = 0.0
+
+    def register(self, session_id: str, owner, platform: str, priority):
+        with self._lock:
+            self._flows[session_id] = BandwidthFlow(owner, platform, BANDWIDTH_WEIGHTS.get(priority, 1))
+
+    def release(self, session_id: str):
+        with self._lock:
+            flow = self._flows.pop(session_id, None)
+            if flow is not None and flow.active:
+                self._rebalance()
+
+    def configure(self, budget, user_cap):
+        with self._lock:
+            self.budget = budget or None
+            self.user_cap = user_cap or None
+            for flow in self._flows.values():
+                flow.demand = None
+            self._rebalance()
+
+    def observe(self, d: dict, session_id: str, cancel_event=None):
+        """Progress hook: charge the bytes received since the previous call"""
+        if d.get("status") != "downloading":
+            return
+        done = d.get("downloaded_bytes") or 0
+        with self._lock:
+            flow = self._flows.get(session_id)
+            if flow is None:
+                return
+            if d.get("filename") != flow.last_file:
+                # New file (e.g. the audio after the video); a resumed one reports what is already on disk
+                flow.last_file, flow.last_bytes = d.get("filename"), done
+                return
+            delta = max(done - flow.last_bytes, 0)
+            flow.last_bytes = done
+        if delta:
+            self.consume(session_id, delta, cancel_event)
+
+    def consume(self, session_id: str, nbytes: int, cancel_event=None):
+        """Charge nbytes to the flow's bucket and sleep until it is back in credit"""
+        with self._lock:
+            flow = self._flows.get(session_id)
+            if flow is None:
+                return
+            now = time.monotonic()
+            flow.bytes += nbytes
+            flow.window_bytes += nbytes
+            if not flow.active:
+                flow.active = True
+                self._rebalance()
+            elif now - self._measured >= BANDWIDTH_REBALANCE_INTERVAL:
+                self._measure(now)
+                self._rebalance()
+            if flow.rate is None:
+                return
+            flow.tokens = min(flow.tokens + (now - flow.refilled) * flow.rate, flow.rate * BANDWIDTH_BURST)
+            flow.refilled = now
+            flow.tokens -= nbytes
+            if flow.tokens >= 0:
+                return
+            wait = -flow.tokens / flow.rate
+            flow.waited = True
+            self.throttled_seconds += wait
+        # A cancelled job wakes up at once instead of sleeping off its debt
+        if cancel_event is not None:
+            cancel_event.wait(wait)
+        else:
+            time.sleep(wait)
+
+    def _measure(self, now: float):
+        elapsed = now - self._measured
+        self._measured = now
+        for flow in self._flows.values():
+            if not flow.window_bytes and not flow.waited:
+                # Extracting, postprocessing or between formats: give its share away until bytes flow again
+                flow.active = False
+                flow.demand = None
+            elif flow.rate is not None and not flow.waited:
+                # Ran below its rate without touching the bucket: something else limits it
+                flow.demand = max(flow.window_bytes / elapsed * BANDWIDTH_DEMAND_HEADROOM, BANDWIDTH_MIN_RATE)
+            else:
+                flow.demand = None
+            flow.window_bytes = 0
+            flow.waited = False
+
+    def _rebalance(self):
+        flows = [flow for flow in self._flows.values() if flow.active]
+        constraints = []
+        if self.budget:
+            constraints.append((self.budget, flows))
+        by_owner, by_platform = {}, {}
+        for flow in flows:
+            by_owner.setdefault(flow.owner, []).append(flow)
+            by_platform.setdefault(flow.platform, []).append(flow)
+            if flow.demand:
+                constraints.append((flow.demand, [flow]))
+        if self.user_cap:
+            constraints.extend((self.user_cap, members) for members in by_owner.values())
+        for platform, members in by_platform.items():
+            cap = platform_registry.tunable(platform, "bandwidth_cap")
+            if cap:
+                constraints.append((cap, members))
+
+        # Progressive filling: raise all unfrozen rates together, freeze the flows of each constraint that fills up
+        rates = {flow: 0.0 for flow in flows}
+        unfrozen = set(flows)
+        while unfrozen:
+            step = None
+            for limit, members in constraints:
+                live = [flow for flow in members if flow in unfrozen]
+                if live:
+                    room = (limit - sum(rates[flow] for flow in members)) / sum(flow.weight for flow in live)
+                    step = room if step is None else min(step, room)
+            if step is None:
+                break  # what is left is under no constraint at all
+            for flow in unfrozen:
+                rates[flow] += max(step, 0.0) * flow.weight
+            for limit, members in constraints:
+                if sum(rates[flow] for flow in members) >= limit * (1 - 1e-9):
+                    unfrozen.difference_update(members)
+
+        for flow in self._flows.values():
+            if flow.active and flow not in unfrozen:
+                flow.rate = max(rates[flow], BANDWIDTH_MIN_RATE)
+            else:
+                flow.rate = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            rates = [flow.rate for flow in self._flows.values() if flow.rate is not None]
+            return {
+                "budget": self.budget,
+                "user_cap": self.user_cap,
+                "allocated": round(sum(rates)) if rates else None,
+                "throttled_seconds": round(self.throttled_seconds, 1),
+                "flows": {
+                    sid: {
+                        "owner": flow.owner,
+                        "platform": flow.platform,
+                        "weight": flow.weight,
+                        "active": flow.active,
+                        "rate": round(flow.rate) if flow.rate is not None else None,
+                        "demand": round(flow.demand) if flow.demand else None,
+                        "bytes": flow.bytes,
+                    }
+                    for sid, flow in self._flows.items()
+                },
+            }
+
+
+bandwidth_manager = BandwidthManager()
+
+
+# --- Job Store ---
+# Session and job state is mirrored to SQLite on every status change so a restart loses nothing
+JOB_STORE_FIELDS = ("session_id", "job_id", "url", "media", "quality", "cookie_file", "user_id",
+                    "owner", "priority", "status", "filepath", "filename", "error", "worker", "batch_id")
+JOB_STORE_COLUMNS = JOB_STORE_FIELDS + ("files", "items", "extractor", "media_id", "updated_at")
+
+JOB_UPSERT = f'''
+    INSERT INTO download_jobs ({", ".join(JOB_STORE_COLUMNS)})
+    VALUES ({", ".join("?" * len(JOB_STORE_COLUMNS))})
+    ON CONFLICT (session_id) DO UPDATE SET
+        {", ".join(f"{c} = excluded.{c}" for c in JOB_STORE_COLUMNS[1:])}
+'''
+
+JOB_DELETE = "DELETE FROM download_jobs WHERE session_id = ?"
+
+RESUMABLE_STATUSES = ("queued", "starting", "downloading", "processing")
+
+
+def persist_progress(*progs: DownloadProgress):
+    """Queue the current state of these sessions for the job store; stream-through sessions are not kept.
+
+    A playlist parent's row also lists its children in playlist order.
+    """
+    now = time.time()
+    for prog in {p.session_id: p for p in progs}.values():
+        if prog.stream_format:
+            continue
+        extractor, media_id = prog.artifact[:2] if prog.artifact else (None, None)
+        row = tuple(getattr(prog, field) for field in JOB_STORE_FIELDS)
+        files = json.dumps(prog.files) if len(prog.files) > 1 else None
+        batch = batches.get(prog.session_id)
+        items = json.dumps(batch.items) if batch else None
+        event_writer.submit(JOB_UPSERT, row + (files, items, extractor, media_id, now), block=True)
+
+
+def forget_progress(session_id: str):
+    event_writer.submit(JOB_DELETE, (session_id,), block=True)
+
+
+def progress_from_row(row) -> DownloadProgress:
+    prog = DownloadProgress(row["session_id"])
+    for field in JOB_STORE_FIELDS:
+        setattr(prog, field, row[field])
+    prog.filepath = prog.filepath or ""
+    prog.filename = prog.filename or ""
+    prog.files = json.loads(row["files"]) if row["files"] else [p for p in (prog.filepath,) if p]
+    if row["items"]:
+        prog.items_total = len(json.loads(row["items"]))
+    if row["status"] in FINAL_STATUSES:
+        prog.finished_at = row["updated_at"]
+    if row["status"] == "completed":
+        prog.progress = 100.0
+        if row["extractor"] and row["media_id"]:
+            prog.artifact = (row["extractor"], row["media_id"], prog.media, prog.quality)
+    return prog
+
+
+def adopt_orphaned_jobs(workers: list):
+    """Hand stored sessions of serving processes that no longer exist to the first of these"""
+    conn = open_db_connection()
+    try:
+        with conn:
+            adopted = conn.execute(
+                f"UPDATE download_jobs SET worker = ? WHERE worker IS NULL OR worker NOT IN "
+                f"({', '.join('?' * len(workers))})", (workers[0], *workers)).rowcount
+    finally:
+        conn.close()
+    if adopted:
+        log.info(f"Job store: {workers[0]} adopted {adopted} sessions of retired workers")
+
+
+def recover_sessions():
+    """Reload stored sessions after a restart and requeue jobs that were cut off.
+
+    Finished sessions come back with their files (while they are still on
+    disk and inside the grace period) and repopulate the artifact index.
+    Interrupted jobs go back on the scheduler under their old id; yt-dlp
+    continues from the .part files the previous run left (continuedl is on
+    by default), so only the missing bytes are fetched again. Playlists
+    get their batch back; items that had not reached the scheduler are
+    released BATCH_PARALLEL at a time as before. Only the sessions this
+    serving process owns are loaded.
+    """
+    conn = open_db_connection()
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute("SELECT * FROM download_jobs WHERE worker = ? ORDER BY updated_at",
+                            (WORKER_NAME,)).fetchall()
+    finally:
+        conn.close()
+
+    now = time.time()
+    restored = {}
+    playlists = {}  # parent session id -> child session ids
+    stale = []
+    for row in rows:
+        status = row["status"]
+        if status in FINAL_STATUSES:
+            missing = (status == "completed" and not row["items"]
+                       and not (row["filepath"] and os.path.exists(row["filepath"])))
+            if missing or now - row["updated_at"] > SESSION_GRACE_PERIOD:
+                stale.append(row["session_id"])
+                continue
+        prog = progress_from_row(row)
+        restored[prog.session_id] = prog
+        if row["items"]:
+            playlists[prog.session_id] = json.loads(row["items"])
+
+    resumed = []
+    orphaned = []
+    for prog in restored.values():
+        if prog.session_id in playlists:
+            continue
+        if prog.batch_id and not prog.job_id and prog.status not in FINAL_STATUSES:
+            # Playlist item the batch had not released yet
+            if prog.batch_id not in playlists:
+                prog.status = "error"
+                prog.error = "Download was interrupted by a server restart. Please try again."
+                orphaned.append(prog)
+        elif prog.job_id:
+            job_prog = restored.get(prog.job_id)
+            if job_prog and prog.status not in ("cancelled", "expired"):
+                job_prog.subscribers.append(prog.session_id)
+            elif not job_prog and prog.status not in FINAL_STATUSES:
+                prog.status = "error"
+                prog.error = "Download was interrupted by a server restart. Please try again."
+                orphaned.append(prog)
+        elif prog.status in RESUMABLE_STATUSES and prog.url:
+            resumed.append(prog)
+        if prog.artifact:
+            prog.request_key = download_request_key(prog.url, prog.media, prog.quality, prog.cookie_file)
+            record_artifact(prog.request_key, prog.artifact, prog.filepath)
+
+    download_sessions.update(restored)
+    for prog in resumed:
+        prog.status = "queued"
+        prog.request_key = download_request_key(prog.url, prog.media, prog.quality, prog.cookie_file)
+        with coalesce_lock:
+            inflight_jobs[prog.request_key] = prog.session_id
+        fan_out(prog)
+        download_scheduler.submit(DownloadJob(prog.session_id, prog.url, prog.media, prog.quality,
+                                              prog.cookie_file, user_id=prog.user_id, owner=prog.owner,
+                                              priority=prog.priority if prog.priority is not None
+                                              else PRIORITY_ANONYMOUS))
+    persist_progress(*orphaned)
+    for prog in restored.values():
+        if prog.subscribers and prog.status in FINAL_STATUSES:
+            # Sessions still waiting on a job that finished just before the restart
+            persist_progress(*fan_out(prog))
+    for batch_id, items in playlists.items():
+        restore_batch(restored[batch_id], items)
+    for session_id in stale:
+        forget_progress(session_id)
+
+    if restored or stale:
+        log.info(f"Job store: restored {len(restored)} sessions, resumed {len(resumed)} downloads, "
+                 f"dropped {len(stale)} expired")
+
+
+# --- Cluster ---
+CLUSTER_POLL_INTERVAL = 0.5  # seconds between checks for commands from other serving processes
+CLUSTER_RESTART_DELAY = 2.0  # seconds before the supervisor restarts a serving process that exited
+CLUSTER_RESTART_MAX_DELAY = 300.0  # cap of the doubling delay for a worker that keeps exiting
+CLUSTER_STABLE_UPTIME = 60.0  # a worker that ran this long restarts after the base delay again
+
+
+class ClusterNode:
+    """Lets serving processes act on the dispatcher's sessions through the job store.
+
+    Sessions live in the dispatcher. Another process answers status
+    lookups from the session's download_jobs row, and forwards
+    cancellation to the owner as a row in cluster_commands. The owner picks
+    those up on its next poll, or after a restart if it was down.
+    """
+
+    def __init__(self, interval=CLUSTER_POLL_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self.lookups = 0
+        self.commands_sent = 0
+        self.commands_handled = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name="cluster", daemon=True)
+            self._thread.start()
+
+    def lookup(self, session_id: str):
+        """Read-only snapshot of a session owned by another serving process"""
+        conn = db_pool.acquire()
+        try:
+            row = conn.execute("SELECT * FROM download_jobs WHERE session_id = ?", (session_id,)).fetchone()
+        finally:
+            db_pool.release(conn)
+        with self._lock:
+            self.lookups += 1
+        if not row or row["worker"] == WORKER_NAME:
+            return None
+        return progress_from_row(row)
+
+    def send(self, prog: DownloadProgress, command: str):
+        event_writer.submit("INSERT INTO cluster_commands (worker, session_id, command, created_at) "
+                            "VALUES (?, ?, ?, ?)", (prog.worker, prog.session_id, command, time.time()),
+                            block=True)
+        with self._lock:
+            self.commands_sent += 1
+
+    def batch_complete_payload(self, prog: DownloadProgress) -> dict:
+        """download_complete payload of a playlist another serving process runs"""
+        conn = db_pool.acquire()
+        try:
+            row = conn.execute("SELECT items FROM download_jobs WHERE session_id = ?", (prog.session_id,)).fetchone()
+            children = {r["session_id"]: r for r in conn.execute(
+                "SELECT session_id, status, filename FROM download_jobs WHERE batch_id = ?", (prog.session_id,))}
+        finally:
+            db_pool.release(conn)
+        items = [children[sid] for sid in json.loads(row["items"] if row and row["items"] else "[]")
+                 if sid in children]
+        return {
+            "session_id": prog.session_id,
+            "batch": True,
+            "files": [{"session_id": c["session_id"], "filename": c["filename"]}
+                      for c in items if c["status"] == "completed"],
+            "failed": sum(1 for c in items if c["status"] in FINAL_STATUSES and c["status"] != "completed"),
+        }
+
+    def stats(self) -> dict:
+        manager = socketio.server.manager
+        with self._lock:
+            return {
+                "worker": WORKER_NAME,
+                "workers": SERVE_WORKERS,
+                "lookups": self.lookups,
+                "commands_sent": self.commands_sent,
+                "commands_handled": self.commands_handled,
+                "socket_queue": manager.stats() if isinstance(manager, SqliteSocketManager)
+                else {"backend": getattr(manager, "name", "local")},
+            }
+
+    def _run(self):
+        conn = open_db_connection()
+        while True:
+            try:
+                self._poll(conn)
+            except Exception as e:
+                log.error(f"Cluster command poll failed: {e}")
+            time.sleep(self.interval)
+
+    def _poll(self, conn):
+        rows = conn.execute("SELECT id, session_id, command FROM cluster_commands WHERE worker = ? ORDER BY id",
+                            (WORKER_NAME,)).fetchall()
+        for _, session_id, command in rows:
+            prog = download_sessions.get(session_id)
+            if prog and command == "cancel":
+                cancel_request(prog)
+        if rows:
+            with conn:
+                conn.execute("DELETE FROM cluster_commands WHERE worker = ? AND id <= ?", (WORKER_NAME, rows[-1][0]))
+            with self._lock:
+                self.commands_handled += len(rows)
+
+
+cluster_node = ClusterNode()
+
+
+def find_session(session_id: str):
+    """The session if this process owns it; in multi-worker mode, else a snapshot of another worker's"""
+    prog = download_sessions.get(session_id)
+    if prog is None and CLUSTER_MODE:
+        prog = cluster_node.lookup(session_id)
+    return prog
+
+
+# Routes that start, run or report on jobs; a worker other than the dispatcher forwards them
+DISPATCHED_ENDPOINTS = {"get_video_info_route", "start_download", "download_file", "download_zip", "stream_file",
+                        "admin_stats", "admin_probe_ffmpeg", "admin_reload_platforms", "admin_bandwidth"}
+# Headers the forwarding worker does not copy: per-connection ones, and those its own server sets
+FORWARD_SKIP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+                        "trailer", "transfer-encoding", "upgrade", "content-length", "server", "date"}
+
+
+@app.before_request
+def forward_to_dispatcher():
+    """Hand a job request to the dispatcher and relay its answer, body included, as it arrives"""
+    if IS_DISPATCHER or not DISPATCHER_URL or request.endpoint not in DISPATCHED_ENDPOINTS:
+        return None
+    target = urlparse(DISPATCHER_URL)
+    conn = http.client.HTTPConnection(target.hostname, target.port, timeout=DISPATCH_TIMEOUT)
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in FORWARD_SKIP_HEADERS}
+    headers["X-Dispatch-Token"] = DISPATCH_TOKEN
+    headers["X-Dispatch-Client"] = request.remote_addr
+    try:
+        conn.request(request.method, request.full_path if request.query_string else request.path,
+                     body=request.get_data(), headers=headers)
+        upstream = conn.getresponse()
+    except OSError as e:
+        conn.close()
+        log.warning(f"Could not forward {request.path} to {CLUSTER_DISPATCHER}: {e}")
+        return jsonify({"success": False, "error": "The download service is restarting. Please try again."}), 503
+
+    def relay():
+        try:
+            while chunk := upstream.read1(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            conn.close()
+
+    response = Response(relay(), status=upstream.status,
+                        headers=[(k, v) for k, v in upstream.getheaders() if k.lower() not in FORWARD_SKIP_HEADERS])
+    if upstream.getheader("Content-Length"):
+        response.headers["Content-Length"] = upstream.getheader("Content-Length")  # lets clients show progress
+    return response
+
+
+def serve_cluster():
+    """Supervise SERVE_WORKERS serving processes on consecutive ports, restarting any that exits.
+
+    Each worker is this script again with WORKER_NAME and SERVE_PORT set;
+    names are stable, so a restarted dispatcher recovers the jobs. A worker
+    that exits again soon after starting (e.g. its port is taken) waits
+    twice as long before each new attempt.
+    """
+    names = [f"worker-{i}" for i in range(SERVE_WORKERS)]
+    # Jobs only ever run in the dispatcher; this also hands it sessions of older layouts
+    adopt_orphaned_jobs([CLUSTER_DISPATCHER])
+    stopping = threading.Event()
+    host = "127.0.0.1" if SERVE_HOST in ("", "0.0.0.0", "::") else SERVE_HOST
+    dispatch = {"DISPATCHER_URL": f"http://{host}:{SERVE_PORT}", "DISPATCH_TOKEN": secrets.token_hex(16)}
+
+    def spawn(i: int):
+        env = dict(os.environ, WORKER_NAME=names[i], SERVE_PORT=str(SERVE_PORT + i), **dispatch)
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+        log.info(f"Started {names[i]} (pid {proc.pid}) on http://{SERVE_HOST}:{SERVE_PORT + i}")
+        return proc
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    procs = [spawn(i) for i in range(SERVE_WORKERS)]
+    started = [time.monotonic()] * SERVE_WORKERS
+    delays = [CLUSTER_RESTART_DELAY] * SERVE_WORKERS
+    restart_at = [None] * SERVE_WORKERS
+    try:
+        while not stopping.wait(1.0):
+            now = time.monotonic()
+            for i, proc in enumerate(procs):
+                if proc.poll() is None:
+                    continue
+                if restart_at[i] is None:
+                    if now - started[i] >= CLUSTER_STABLE_UPTIME:
+                        delays[i] = CLUSTER_RESTART_DELAY
+                    restart_at[i] = now + delays[i]
+                    log.warning(f"{names[i]} exited with status {proc.returncode}; "
+                                f"restarting in {delays[i]:.0f}s")
+                    delays[i] = min(delays[i] * 2, CLUSTER_RESTART_MAX_DELAY)
+                elif now >= restart_at[i]:
+                    procs[i] = spawn(i)
+                    started[i] = now
+                    restart_at[i] = None
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+# --- Playlist Batches ---
+BATCH_MAX_ENTRIES = 500
+BATCH_PARALLEL = 3  # items of one playlist handed to the scheduler at a time
+
 
-        socketio.emit("download_error", {"session_id": session_id, "error": prog.error})
+class PlaylistBatch:
+    """A playlist download: one parent session following a child session per entry.
+
+    Children are released to the scheduler BATCH_PARALLEL at a time, so a
+    long playlist neither floods the queue nor holds every worker.
+    """
+
+    def __init__(self, prog: DownloadProgress, owner, priority):
+        self.prog = prog
+        self.owner = owner
+        self.priority = priority
+        self.items = []  # child session ids in playlist order
+        self.pending = deque()  # children not handed to the scheduler yet
+        self.running = set()
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+
+batches = {}  # parent session id -> PlaylistBatch
+
+
+def extract_playlist(url: str, cookie_file_path=None):
+    """Flat-extract a playlist or channel once; returns (title, entries), entries empty for a single item"""
+    opts = ydl_base_opts(cookie_file_path, url) | {
+        "noplaylist": False,
+        "extract_flat": "in_playlist",
+        "playlistend": BATCH_MAX_ENTRIES,
+    }
+    with ydl_pool.lease(opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if info.get("_type") not in ("playlist", "multi_video"):
+        return None, []
+    return info.get("title"), [e for e in info.get("entries") or [] if e and (e.get("url") or e.get("webpage_url"))]
+
+
+def start_batch(url: str, media: str, quality: str, cookie_file_path, title, entries: list,
+                user_id, owner, priority) -> PlaylistBatch:
+    batch_id = str(uuid.uuid4())
+    parent = DownloadProgress(batch_id)
+    parent.status = "downloading"
+    parent.filename = title or "playlist"
+    parent.url, parent.media, parent.quality = url, media, quality
+    parent.user_id = user_id
+    batch = PlaylistBatch(parent, owner, priority)
+
+    for entry in entries:
+        child = DownloadProgress(str(uuid.uuid4()))
+        child.batch_id = batch_id
+        child.url = entry.get("url") or entry.get("webpage_url")
+        child.media, child.quality = media, quality
+        child.cookie_file = cookie_file_path
+        child.user_id = user_id
+        child.filename = entry.get("title") or ""
+        download_sessions[child.session_id] = child
+        batch.items.append(child.session_id)
+
+        # Entries already on disk are done without touching the extractor again
+        existing = lookup_artifact((entry.get("ie_key"), entry.get("id"), media, quality)) \
+            or lookup_artifact_for_request(download_request_key(child.url, media, quality, cookie_file_path))
+        if existing:
+            child.status = "completed"
+            child.progress = 100.0
+            child.filepath = existing
+            child.filename = os.path.basename(existing)
+            batch.skipped += 1
+        else:
+            batch.pending.append(child)
+
+    download_sessions[batch_id] = parent
+    batches[batch_id] = batch
+    # Parent row first, so a restart never finds items of a playlist it does not know
+    persist_progress(parent, *(download_sessions[sid] for sid in batch.items))
+    log.info(f"Playlist {url}: {len(entries)} entries, {batch.skipped} already downloaded")
+    pump_batch(batch)
+    update_batch(batch_id, force=True)
+    return batch
+
+
+def restore_batch(parent: DownloadProgress, items: list):
+    """Rebuild a stored playlist: items already with a job are running, the others wait their turn again"""
+    batch = PlaylistBatch(parent, parent.owner,
+                          parent.priority if parent.priority is not None else PRIORITY_ANONYMOUS)
+    batch.items = items
+    children = [c for c in (download_sessions.get(sid) for sid in items) if c]
+    if parent.status not in FINAL_STATUSES:
+        for child in children:
+            if child.status in FINAL_STATUSES:
+                continue
+            if child.job_id:
+                batch.running.add(child.session_id)
+            else:
+                batch.pending.append(child)
+    parent.items_total = len(children)
+    parent.items_done = sum(1 for c in children if c.status in FINAL_STATUSES)
+    parent.items_failed = sum(1 for c in children if c.status in FINAL_STATUSES and c.status != "completed")
+    batches[parent.session_id] = batch
+    pump_batch(batch)
+    update_batch(parent.session_id, force=True)
+
+
+def pump_batch(batch: PlaylistBatch):
+    """Hand pending children to the scheduler until BATCH_PARALLEL of them are in flight"""
+    released = []
+    with batch.lock:
+        while batch.pending and len(batch.running) < BATCH_PARALLEL:
+            child = batch.pending.popleft()
+            if child.status == "cancelled":
+                continue
+            batch.running.add(child.session_id)
+            released.append(child)
+    # Submitting publishes queue positions, which calls back into update_batch
+    for child in released:
+        queue_download(child, batch.owner, batch.priority)
+
+
+def batch_items_finished(progs: list):
+    """Called once sessions reach a final status; frees their batch slots and reports the item"""
+    for prog in progs:
+        batch = batches.get(prog.batch_id) if prog.batch_id else None
+        if not batch:
+            continue
+        with batch.lock:
+            batch.running.discard(prog.session_id)
+        socketio.emit("batch_item_update", progress_payload(prog), to=prog.batch_id)
+        pump_batch(batch)
+        update_batch(prog.batch_id, force=True)
+
+
+def update_batch(batch_id: str, force=False):
+    """Recompute a playlist's aggregate progress from its children and push it to the parent room"""
+    batch = batches.get(batch_id)
+    if not batch:
+        return
+    parent = batch.prog
+    if parent.status in FINAL_STATUSES or (
+            not force and time.monotonic() - parent.last_emit < PROGRESS_EMIT_INTERVAL):
+        return
+
+    children = [c for c in (download_sessions.get(sid) for sid in batch.items) if c]
+    done = [c for c in children if c.status in FINAL_STATUSES]
+    active = [c for c in children if c.status not in FINAL_STATUSES]
+    parent.items_total = len(children)
+    parent.items_done = len(done)
+    parent.items_failed = sum(1 for c in done if c.status != "completed")
+    parent.progress = sum(c.progress for c in children) / len(children) if children else 100.0
+    parent.downloaded_bytes = sum(c.downloaded_bytes or 0 for c in children)
+    parent.total_bytes = sum(c.total_bytes or 0 for c in children) or None
+    parent.speed = sum(c.speed or 0 for c in active) or None
+    parent.eta = None
+
+    if len(done) < len(children):
+        emit_progress(parent, force=force)
+        return
+
+    completed = [c for c in done if c.status == "completed"]
+    parent.status = "completed" if completed else "error"
+    if not completed:
+        parent.error = "No playlist item could be downloaded."
+    parent.progress = 100.0
+    emit_progress(parent, force=True)
+    if completed:
+        socketio.emit("download_complete", batch_complete_payload(batch), to=batch_id)
+    else:
+        socketio.emit("download_error", {"session_id": batch_id, "error": parent.error}, to=batch_id)
+
+
+def batch_complete_payload(batch: PlaylistBatch) -> dict:
+    completed = [c for c in (download_sessions.get(sid) for sid in batch.items) if c and c.status == "completed"]
+    return {
+        "session_id": batch.prog.session_id,
+        "batch": True,
+        "files": [{"session_id": c.session_id, "filename": c.filename} for c in completed],
+        "failed": batch.prog.items_failed,
+    }
+
+
+def cancel_batch(batch: PlaylistBatch):
+    with batch.lock:
+        batch.pending.clear()
+        batch.running.clear()
+    batch.prog.status = "cancelled"
+    persist_progress(batch.prog)
+    for sid in batch.items:
+        child = download_sessions.get(sid)
+        if child and child.status not in FINAL_STATUSES:
+            cancel_session(child)
 
 
 # --- Authentication Routes ---
@@ -813,9 +4216,9 @@ def admin_dashboard():
     stats = db.execute('''
         SELECT 
             (SELECT COUNT(*) FROM users WHERE is_admin = 0) as total_users,
-            (SELECT COUNT(*) FROM user_activities) as total_downloads,
+            (SELECT COALESCE(SUM(total_downloads), 0) FROM user_download_stats) as total_downloads,
             (SELECT COUNT(*) FROM contact_submissions WHERE status = 'unread') as unread_messages,
-            (SELECT COUNT(*) FROM traffic_stats WHERE DATE(created_at) = DATE('now')) as today_visits
+            (SELECT COALESCE(SUM(visits), 0) FROM traffic_daily WHERE day = DATE('now')) as today_visits
     ''').fetchone()
 
     # Get recent activities
@@ -829,47 +4232,197 @@ def admin_dashboard():
 
     # Get traffic stats for last 7 days
     traffic_stats = db.execute('''
-        SELECT DATE(created_at) as date, COUNT(*) as visits
-        FROM traffic_stats 
-        WHERE created_at >= date('now', '-7 days')
-        GROUP BY DATE(created_at)
-        ORDER BY date DESC
+        SELECT day as date, SUM(visits) as visits
+        FROM traffic_daily
+        WHERE day >= date('now', '-7 days')
+        GROUP BY day
+        ORDER BY day DESC
     ''').fetchall()
 
     return render_template("admin_dashboard.html",
                            stats=stats,
                            recent_activities=recent_activities,
-                           traffic_stats=traffic_stats)
+                           traffic_stats=traffic_stats,
+                           bandwidth=bandwidth_manager.stats())
+
+
+# --- Admin Pagination ---
+ADMIN_PAGE_SIZE = 50
+INBOX_STATUSES = ('unread', 'read')
+
+
+def encode_cursor(row) -> str:
+    """Opaque keyset cursor for the (created_at, id) of the last row on a page"""
+    raw = f"{row['created_at']}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return created_at, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def page_limit():
+    try:
+        return max(1, min(int(request.args.get('limit', ADMIN_PAGE_SIZE)), ADMIN_PAGE_SIZE))
+    except ValueError:
+        return ADMIN_PAGE_SIZE
+
+
+def fetch_page(db, base_sql, params, cursor, limit):
+    """Run a newest-first keyset query; base_sql must end in a WHERE clause to extend"""
+    sql = base_sql
+    args = list(params)
+    after = decode_cursor(cursor)
+    if after:
+        sql += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+        args += [after[0], after[0], after[1]]
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    rows = db.execute(sql, args + [limit + 1]).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def fetch_users_page(db, cursor=None, limit=ADMIN_PAGE_SIZE, search=None):
+    """One page of non-admin users, optionally those whose username or email contains search"""
+    sql = '''
+        SELECT * FROM (
+            SELECT u.*,
+                   COALESCE(s.total_downloads, 0) as total_downloads,
+                   s.last_download
+            FROM users u
+            LEFT JOIN user_download_stats s ON u.id = s.user_id
+            WHERE u.is_admin = 0
+        ) WHERE 1 = 1
+    '''
+    params = ()
+    if search:
+        pattern = "%" + re.sub(r"([\\%_])", r"\\\1", search) + "%"
+        sql += r" AND (username LIKE ? ESCAPE '\' OR email LIKE ? ESCAPE '\')"
+        params = (pattern, pattern)
+    return fetch_page(db, sql, params, cursor, limit)
+
+
+def fetch_inbox_page(db, status=None, cursor=None, limit=ADMIN_PAGE_SIZE):
+    if status in INBOX_STATUSES:
+        return fetch_page(db, "SELECT * FROM contact_submissions WHERE status = ?", (status,), cursor, limit)
+    return fetch_page(db, "SELECT * FROM contact_submissions WHERE 1 = 1", (), cursor, limit)
 
 
 @app.route("/admin/users")
 @admin_required
 def admin_users():
     db = get_db()
-    users = db.execute('''
-        SELECT u.*, 
-               COUNT(ua.id) as total_downloads,
-               MAX(ua.created_at) as last_download
-        FROM users u 
-        LEFT JOIN user_activities ua ON u.id = ua.user_id 
-        WHERE u.is_admin = 0
-        GROUP BY u.id 
-        ORDER BY u.created_at DESC
-    ''').fetchall()
+    users, next_cursor = fetch_users_page(db)
+    total_users = db.execute("SELECT COUNT(*) FROM users WHERE is_admin = 0").fetchone()[0]
 
-    return render_template("admin_users.html", users=users)
+    return render_template("admin_users.html", users=users, next_cursor=next_cursor, total_users=total_users)
+
+
+@app.route("/admin/api/users")
+@admin_required
+def admin_users_api():
+    search = request.args.get('q', '').strip()[:100]
+    users, next_cursor = fetch_users_page(get_db(), request.args.get('cursor'), page_limit(), search)
+    return jsonify({
+        "success": True,
+        "html": render_template("admin_users_rows.html", users=users),
+        "count": len(users),
+        "next_cursor": next_cursor
+    })
 
 
 @app.route("/admin/inbox")
 @admin_required
 def admin_inbox():
     db = get_db()
-    messages = db.execute('''
-        SELECT * FROM contact_submissions 
-        ORDER BY created_at DESC
-    ''').fetchall()
+    status = request.args.get('status')
+    if status not in INBOX_STATUSES:
+        status = None
+    messages, next_cursor = fetch_inbox_page(db, status)
+
+    counts = {"all": 0, "unread": 0, "read": 0}
+    for row in db.execute("SELECT status, COUNT(*) as n FROM contact_submissions GROUP BY status"):
+        counts["all"] += row['n']
+        if row['status'] in counts:
+            counts[row['status']] = row['n']
 
-    return render_template("admin_inbox.html", messages=messages)
+    return render_template("admin_inbox.html", messages=messages, next_cursor=next_cursor,
+                           counts=counts, status=status or 'all')
+
+
+@app.route("/admin/api/inbox")
+@admin_required
+def admin_inbox_api():
+    status = request.args.get('status')
+    messages, next_cursor = fetch_inbox_page(get_db(), status, request.args.get('cursor'), page_limit())
+    return jsonify({
+        "success": True,
+        "html": render_template("admin_inbox_items.html", messages=messages),
+        "count": len(messages),
+        "next_cursor": next_cursor
+    })
+
+
+@app.route("/admin/stats")
+@admin_required
+def admin_stats():
+    """Runtime counters for the download pipeline and background writers"""
+    return jsonify({
+        "scheduler": download_scheduler.stats(),
+        "metadata_cache": metadata_cache.stats(),
+        "event_writer": event_writer.stats(),
+        "retention": retention_manager.stats(),
+        "cancellation": dict(cancellation_stats),
+        "platforms": platform_registry.stats(),
+        "ffmpeg": ffmpeg_capabilities().as_dict(),
+        "job_timings": job_timing_stats(),
+        "fragments": fragment_controller.stats(),
+        "cookies": cookie_index.stats(),
+        "cookie_jars": cookie_jars.stats(),
+        "ydl_pool": ydl_pool.stats(),
+        "engine": download_engine.stats(),
+        "bandwidth": bandwidth_manager.stats(),
+        "cluster": cluster_node.stats(),
+    })
+
+
+@app.route("/admin/probe_ffmpeg", methods=["POST"])
+@admin_required
+def admin_probe_ffmpeg():
+    """Re-detect ffmpeg/ffprobe, e.g. after installing or upgrading them, and rebuild option templates"""
+    caps = ffmpeg_capabilities(refresh=True)
+    platform_registry.reload(force=True)
+    return jsonify({"success": True, "ffmpeg": caps.as_dict()})
+
+
+@app.route("/admin/reload_platforms", methods=["POST"])
+@admin_required
+def admin_reload_platforms():
+    """Re-read the platform profile file now instead of waiting for the next mtime check"""
+    platform_registry.reload(force=True)
+    return jsonify({"success": True, "platforms": platform_registry.stats()})
+
+
+@app.route("/admin/bandwidth", methods=["POST"])
+@admin_required
+def admin_bandwidth():
+    """Change the global budget and per-owner cap (bytes/s, 0 = unlimited); running transfers pick them up at once"""
+    data = request.get_json() or {}
+    try:
+        budget = int(data.get("budget", bandwidth_manager.budget or 0))
+        user_cap = int(data.get("user_cap", bandwidth_manager.user_cap or 0))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "budget and user_cap must be integers"}), 400
+    if budget < 0 or user_cap < 0:
+        return jsonify({"success": False, "error": "budget and user_cap must not be negative"}), 400
+    bandwidth_manager.configure(budget, user_cap)
+    return jsonify({"success": True, "bandwidth": bandwidth_manager.stats()})
 
 
 @app.route("/admin/change_password", methods=["GET", "POST"])
@@ -918,9 +4471,7 @@ def admin_change_password():
 # --- Main Routes ---
 @app.route("/")
 def index():
-    cleanup_old_cookies()
-    available_cookies = get_available_cookies()
-    return render_template("index.html", cookies=available_cookies)
+    return render_template("index.html", cookies=cookie_index.cookies())
 
 
 @app.route("/privacy")
@@ -1013,6 +4564,7 @@ def upload_cookies():
                 os.remove(file_path)
                 return jsonify({"error": "Cookie file is empty"}), 400
 
+        cookie_index.add(filename)
         log.info(f"Cookie file uploaded: {filename}")
         return jsonify({
             "success": True,
@@ -1028,9 +4580,7 @@ def upload_cookies():
 @app.route("/delete_cookies/<cookie_name>", methods=["POST"])
 def delete_cookies(cookie_name):
     try:
-        file_path = os.path.join(COOKIES_DIR, f"{cookie_name}.txt")
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        if cookie_index.remove(cookie_name):
             log.info(f"Cookie file deleted: {cookie_name}")
             return jsonify({"success": True, "message": "Cookie file deleted"})
         else:
@@ -1056,12 +4606,8 @@ def get_video_info_route():
         # Get cookie file path if specified
         cookie_file_path = None
         if cookie_name:
-            if cookie_name == "default":
-                cookie_file_path = os.path.join(BASE_DIR, "cookies.txt")
-            else:
-                cookie_file_path = os.path.join(COOKIES_DIR, f"{cookie_name}.txt")
-
-            if not os.path.exists(cookie_file_path):
+            cookie_file_path = cookie_index.resolve(cookie_name)
+            if not cookie_file_path:
                 return jsonify({"error": f"Cookie file '{cookie_name}' not found"}), 400
 
         info_raw = extract_info_only(url, cookie_file_path)
@@ -1128,50 +4674,286 @@ def start_download():
 
     cookie_file_path = None
     if cookie_name:
-        if cookie_name == "default":
-            cookie_file_path = os.path.join(BASE_DIR, "cookies.txt")
-        else:
-            cookie_file_path = os.path.join(COOKIES_DIR, f"{cookie_name}.txt")
-
-        if not os.path.exists(cookie_file_path):
+        cookie_file_path = cookie_index.resolve(cookie_name)
+        if not cookie_file_path:
             return jsonify({"error": f"Cookie file '{cookie_name}' not found"}), 400
 
-    session_id = str(uuid.uuid4())
-    download_sessions[session_id] = DownloadProgress(session_id)
+    if session.get('is_admin'):
+        priority = PRIORITY_ADMIN
+    elif user_id:
+        priority = PRIORITY_USER
+    else:
+        priority = PRIORITY_ANONYMOUS
+    owner = user_id or request.remote_addr
 
-    t = threading.Thread(target=download_job, args=(url, media, quality, session_id, cookie_file_path), daemon=True)
-    t.start()
+    if data.get("playlist"):
+        try:
+            title, entries = extract_playlist(url, cookie_file_path)
+        except Exception as e:
+            return jsonify({"error": f"Could not read playlist: {e}"}), 400
+        if entries:
+            batch = start_batch(url, media, quality, cookie_file_path, title, entries, user_id, owner, priority)
+            return jsonify({"success": True, "session_id": batch.prog.session_id, "batch": True,
+                            "items_total": batch.prog.items_total, "items_done": batch.prog.items_done,
+                            "message": f"Queued {len(entries)} playlist items"})
+        # Not a playlist after all: download it as a single item
 
-    return jsonify({"success": True, "session_id": session_id, "message": "Download started"})
+    session_id = str(uuid.uuid4())
+    prog = DownloadProgress(session_id)
+    prog.user_id = user_id
+    prog.url, prog.media, prog.quality = url, media, quality
+    prog.cookie_file = cookie_file_path
+    download_sessions[session_id] = prog
+    request_key = download_request_key(url, media, quality, cookie_file_path)
+
+    # Identical request already finished: serve the file on disk without downloading again
+    existing = lookup_artifact_for_request(request_key)
+    if existing:
+        prog.status = "completed"
+        prog.progress = 100.0
+        prog.filepath = existing
+        prog.filename = os.path.basename(existing)
+        persist_progress(prog)
+        if user_id:
+            log_user_activity(user_id, 'download_completed', url=url, format=media, quality=quality,
+                              filename=prog.filename, status='completed')
+        return jsonify({"success": True, "session_id": session_id, "status": "completed",
+                        "filename": prog.filename, "message": "File ready"})
+
+    # Single-stream result nothing else is fetching: pipe it straight to the client
+    if data.get("stream") and stream_slots.acquire(blocking=False):
+        try:
+            fmt = plan_stream(url, media, quality, cookie_file_path)
+        except Exception as e:
+            log.info(f"Stream planning failed for {url}, using staged download: {e}")
+            fmt = None
+        if fmt:
+            prog.status = "ready"
+            prog.stream_format = fmt
+            prog.owner, prog.priority = owner, priority
+            prog.filename = fmt["filename"]
+            prog.total_bytes = fmt["filesize"]
+            threading.Timer(STREAM_READY_TIMEOUT, expire_stream, args=(session_id,)).start()
+            return jsonify({"success": True, "session_id": session_id, "status": "ready",
+                            "stream_url": url_for('stream_file', session_id=session_id),
+                            "filename": prog.filename, "message": "Streaming download"})
+        stream_slots.release()
+
+    # Identical request in flight: follow that job instead of starting another
+    if queue_download(prog, owner, priority):
+        return jsonify({"success": True, "session_id": session_id, "message": "Joined download in progress"})
+
+    return jsonify({"success": True, "session_id": session_id, "message": "Download queued"})
+
+
+def attachment_header(filename: str) -> str:
+    return f"attachment; filename*=UTF-8''{quote(filename)}"
+
+
+def send_download(path: str):
+    """Send a finished file with Range/If-Range and validator support, or let the proxy send it"""
+    name = os.path.basename(path)
+    retention_manager.touch(path)
+    if app.config['DOWNLOAD_OFFLOAD'] == 'x-accel':
+        rel = os.path.relpath(path, DOWNLOAD_DIR).replace(os.sep, '/')
+        response = Response(mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream")
+        response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_PREFIX'].rstrip('/') + '/' + quote(rel)
+        response.headers['Content-Disposition'] = attachment_header(name)
+        return response
+
+    # Strong validator from inode, size and mtime; changes whenever the file is replaced
+    st = os.stat(path)
+    etag = f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+    # conditional=True answers Range (206/416), If-Range, If-None-Match and If-Modified-Since
+    response = send_file(path, as_attachment=True, download_name=name, conditional=True,
+                         etag=etag, last_modified=st.st_mtime, max_age=0)
+    # Advertise resumability on the initial 200 so clients retry with Range after a drop
+    response.headers['Accept-Ranges'] = 'bytes'
+
+    # Keep the file safe from eviction until the response has been fully sent
+    retention_manager.acquire(path)
+    response.call_on_close(lambda: retention_manager.release(path))
+    return response
+
+
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+
+class ZipSink:
+    """Unseekable write target for zipfile; each drain() hands back what was written since the last one"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(paths: list):
+    """Yield a ZIP of the given files while it is being written.
+
+    Media is already compressed, so entries are stored. Because the sink
+    cannot seek, zipfile writes sizes and CRCs in data descriptors after each
+    entry. Only one read chunk is held at a time, whatever the total size.
+    """
+    sink = ZipSink()
+    names = set()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for path in paths:
+            stem, ext = os.path.splitext(os.path.basename(path))
+            name = stem + ext
+            n = 1
+            while name in names:
+                n += 1
+                name = f"{stem} ({n}){ext}"
+            names.add(name)
+
+            info = zipfile.ZipInfo.from_file(path, arcname=name)
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, "rb") as src, zf.open(info, "w") as dst:
+                while chunk := src.read(ZIP_CHUNK_SIZE):
+                    dst.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def session_files(prog: DownloadProgress) -> list:
+    """Finished files behind a session: every completed playlist item, every file of a post, or its one file"""
+    batch = batches.get(prog.session_id)
+    if batch:
+        children = (download_sessions.get(sid) for sid in batch.items)
+        paths = [p for child in children if child for p in session_files(child)]
+    elif prog.status == "completed":
+        paths = prog.files or [prog.filepath]
+    else:
+        paths = []
+    return [p for p in dict.fromkeys(paths) if p and os.path.exists(p)]
 
 
 @app.route("/download_file/<session_id>")
 def download_file(session_id):
-    prog = download_sessions.get(session_id)
+    prog = find_session(session_id)
     if not prog:
         return "Session not found", 404
     if prog.status != "completed" or not prog.filepath or not os.path.exists(prog.filepath):
         return "File not ready", 400
-    return send_file(prog.filepath, as_attachment=True, download_name=os.path.basename(prog.filepath))
+    return send_download(prog.filepath)
+
+
+@app.route("/download_zip/<session_id>")
+def download_zip(session_id):
+    prog = find_session(session_id)
+    if not prog:
+        return "Session not found", 404
+    paths = session_files(prog)
+    if not paths:
+        return "File not ready", 400
+
+    name = f"{os.path.splitext(prog.filename)[0] or 'download'}.zip"
+    for path in paths:
+        retention_manager.acquire(path)
+    # No Content-Length: the archive size is only known once it has been written
+    response = Response(iter_zip(paths), mimetype="application/zip",
+                        headers={"Content-Disposition": attachment_header(name)})
+
+    @response.call_on_close
+    def _release_files():
+        for path in paths:
+            retention_manager.release(path)
+
+    return response
+
+
+@app.route("/stream/<session_id>")
+def stream_file(session_id):
+    prog = download_sessions.get(session_id)
+    if not prog or not prog.stream_format:
+        return "Session not found", 404
+    with stream_lock:
+        if prog.status != "ready":
+            return "Stream no longer available", 410
+        prog.status = "streaming"
+    emit_progress(prog)
+
+    headers = {"Content-Disposition": attachment_header(prog.filename)}
+    if prog.total_bytes:
+        headers["Content-Length"] = str(prog.total_bytes)
+    mimetype = mimetypes.guess_type(prog.filename)[0] or "application/octet-stream"
+
+    ydl = open_ydl(ydl_base_opts(prog.cookie_file, prog.url))
+    bandwidth_manager.register(session_id, prog.owner, get_platform_key(prog.url) or "", prog.priority)
+    response = Response(stream_generator(prog, ydl), mimetype=mimetype, headers=headers)
+
+    @response.call_on_close
+    def _release_stream():
+        # Runs once the server is done with the response, whether or not the body was sent
+        ydl.close()
+        stream_slots.release()
+        bandwidth_manager.release(session_id)
+
+    return response
+
+
+def cancel_session(prog: DownloadProgress):
+    with stream_lock:
+        if prog.status == "ready":
+            # Stream URL never opened: hand its slot back now
+            stream_slots.release()
+        prog.status = "cancelled"
+    prog.cancel_event.set()  # stops a stream-through transfer
+
+    # Only stop the underlying job once no other session is following it
+    job_prog = detach_from_job(prog.session_id)
+    if job_prog:
+        if download_scheduler.cancel(job_prog.session_id):
+            job_prog.status = "cancelled"
+            persist_progress(job_prog)
+        elif job_prog.status not in FINAL_STATUSES:
+            request_cancel(job_prog)
+    persist_progress(prog)
+
+
+def cancel_request(prog: DownloadProgress):
+    if prog.session_id in batches:
+        cancel_batch(batches[prog.session_id])
+    else:
+        cancel_session(prog)
+        if prog.batch_id:
+            batch_items_finished([prog])
+    socketio.emit("download_cancelled", {"session_id": prog.session_id}, to=prog.session_id)
 
 
 @app.route("/cancel_download/<session_id>", methods=["POST"])
 def cancel_download(session_id):
-    if session_id in download_sessions:
-        download_sessions[session_id].status = "cancelled"
-        socketio.emit("download_cancelled", {"session_id": session_id})
+    prog = find_session(session_id)
+    if prog:
+        if prog.worker == WORKER_NAME:
+            cancel_request(prog)
+        else:
+            # The owning worker cancels it and emits download_cancelled through the message queue
+            cluster_node.send(prog, "cancel")
         return jsonify({"success": True})
     return jsonify({"error": "Session not found"}), 404
 
 
 @app.route("/get_available_cookies")
 def get_available_cookies_route():
-    return jsonify({"cookies": get_available_cookies()})
+    return jsonify({"cookies": cookie_index.cookies()})
 
 
 @app.route("/bypass-status")
 def bypass_status():
-    available_cookies = get_available_cookies()
+    available_cookies = cookie_index.cookies()
     return jsonify({
         "cookies_available": len(available_cookies) > 0,
         "available_cookies": available_cookies,
@@ -1196,12 +4978,71 @@ def _on_disconnect():
     log.info("Client disconnected")
 
 
+@socketio.on("subscribe")
+def _on_subscribe(data):
+    """Join the room for a download session and replay its current state"""
+    session_id = (data or {}).get("session_id")
+    prog = find_session(session_id)
+    if not prog:
+        if CLUSTER_MODE and session_id:
+            # The dispatcher may not have stored a session it just started yet
+            join_room(session_id)
+        return
+    join_room(session_id)
+
+    job_prog = download_sessions.get(prog.job_id) if prog.job_id else None
+    if job_prog and prog.status != "cancelled":
+        fan_out(job_prog)
+
+    if prog.status == "completed" and session_id in batches:
+        emit("download_complete", batch_complete_payload(batches[session_id]))
+    elif prog.status == "completed" and prog.items_total is not None:
+        emit("download_complete", cluster_node.batch_complete_payload(prog))
+    elif prog.status == "completed":
+        emit("download_complete", {"session_id": session_id, "filename": prog.filename,
+                                   "files_count": len(prog.files)})
+    elif prog.status == "error":
+        emit("download_error", {"session_id": session_id, "error": prog.error})
+    else:
+        emit("progress_update", progress_payload(prog))
+
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Rebuild the admin dashboard rollup tables from the raw event tables."""
+    init_database()
+    event_writer.stop()
+    conn = open_db_connection()
+    try:
+        rebuild_rollups(conn)
+    finally:
+        conn.close()
+    log.info("Rollup tables rebuilt")
+
+
 # --- Main ---
 if __name__ == "__main__":
     init_database()
+    if CLUSTER_MODE and WORKER_NAME == "main":
+        serve_cluster()
+        sys.exit(0)
+    ffmpeg_capabilities()
+    if CLUSTER_MODE:
+        if IS_DISPATCHER:
+            recover_sessions()
+            retention_manager.start()
+            cluster_node.start()
+            threading.Thread(target=warm_ydl_pool, name="ydl-warmup", daemon=True).start()
+    # The reloader runs this block in its watcher process too; only the serving child resumes jobs
+    elif os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        adopt_orphaned_jobs([WORKER_NAME])
+        recover_sessions()
+        # Expires recovered sessions and enforces the quota even before the next download
+        retention_manager.start()
+        threading.Thread(target=warm_ydl_pool, name="ydl-warmup", daemon=True).start()
     log.info("Starting Eliot Downloader with authentication system")
     log.info(f"FFmpeg available: {has_ffmpeg()}")
     log.info(
-        f"Supported platforms with cookie requirements: {[k for k, v in PLATFORM_CONFIGS.items() if v.get('requires_cookies')]}")
-    log.info("Open: http://127.0.0.1:5000")
-    socketio.run(app, host="127.0.0.1", port=5000, debug=True, allow_unsafe_werkzeug=True)
+        f"Supported platforms with cookie requirements: {[k for k, v in platform_registry.profiles().items() if v.get('requires_cookies')]}")
+    log.info(f"Open: http://{SERVE_HOST}:{SERVE_PORT}")
+    socketio.run(app, host=SERVE_HOST, port=SERVE_PORT, debug=not CLUSTER_MODE, allow_unsafe_werkzeug=True)
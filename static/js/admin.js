@@ -1,46 +1,65 @@
 // Admin panel functionality
 document.addEventListener('DOMContentLoaded', function() {
-    // User search functionality
+    // User search: reload the list from the server so users beyond the loaded pages are found
     const userSearch = document.getElementById('userSearch');
-    if (userSearch) {
+    const usersSentinel = document.querySelector('.scroll-sentinel[data-target="usersTableBody"]');
+    if (userSearch && usersSentinel) {
+        let searchTimer = null;
+        let searchSeq = 0;
         userSearch.addEventListener('input', function() {
-            const searchTerm = this.value.toLowerCase();
-            const userRows = document.querySelectorAll('.user-row');
-
-            userRows.forEach(row => {
-                const username = row.querySelector('.user-name').textContent.toLowerCase();
-                const email = row.querySelector('td:nth-child(2)').textContent.toLowerCase();
-
-                if (username.includes(searchTerm) || email.includes(searchTerm)) {
-                    row.style.display = '';
-                } else {
-                    row.style.display = 'none';
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(async () => {
+                const seq = ++searchSeq;
+                const term = userSearch.value.trim();
+                const endpoint = term ? `/admin/api/users?q=${encodeURIComponent(term)}` : '/admin/api/users';
+                // Later pages follow the new query from its first page
+                usersSentinel.setAttribute('data-endpoint', endpoint);
+                usersSentinel.setAttribute('data-next-cursor', '');
+                try {
+                    const response = await fetch(endpoint);
+                    const result = await response.json();
+                    if (result.success && seq === searchSeq) {
+                        document.getElementById('usersTableBody').innerHTML = result.html;
+                        usersSentinel.setAttribute('data-next-cursor', result.next_cursor || '');
+                    }
+                } catch (error) {
+                    console.error('Error searching users:', error);
                 }
-            });
+            }, 250);
         });
     }
 
-    // Filter buttons for inbox
-    const filterBtns = document.querySelectorAll('.filter-btn');
-    filterBtns.forEach(btn => {
-        btn.addEventListener('click', function() {
-            // Update active button
-            filterBtns.forEach(b => b.classList.remove('active'));
-            this.classList.add('active');
-
-            // Filter messages
-            const filter = this.getAttribute('data-filter');
-            const messages = document.querySelectorAll('.message-item');
-
-            messages.forEach(message => {
-                const status = message.getAttribute('data-status');
-                if (filter === 'all' || status === filter) {
-                    message.style.display = '';
-                } else {
-                    message.style.display = 'none';
+    // Infinite scroll: fetch the next keyset page when the sentinel scrolls into view
+    document.querySelectorAll('.scroll-sentinel').forEach(sentinel => {
+        const target = document.getElementById(sentinel.getAttribute('data-target'));
+        let loading = false;
+
+        const loadMore = async function() {
+            const endpoint = sentinel.getAttribute('data-endpoint');
+            const cursor = sentinel.getAttribute('data-next-cursor');
+            if (!cursor || loading) return;
+            loading = true;
+            try {
+                const sep = endpoint.includes('?') ? '&' : '?';
+                const response = await fetch(`${endpoint}${sep}cursor=${encodeURIComponent(cursor)}`);
+                const result = await response.json();
+                // Drop the page if a search replaced the list while it was loading
+                if (result.success && sentinel.getAttribute('data-endpoint') === endpoint) {
+                    target.insertAdjacentHTML('beforeend', result.html);
+                    sentinel.setAttribute('data-next-cursor', result.next_cursor || '');
                 }
-            });
-        });
+            } catch (error) {
+                console.error('Error loading more items:', error);
+            } finally {
+                loading = false;
+            }
+        };
+
+        if ('IntersectionObserver' in window) {
+            new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) loadMore();
+            }, { rootMargin: '400px' }).observe(sentinel);
+        }
     });
 
     // Mark message as read/unread
@@ -69,20 +88,20 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    // Reply modal
-    const replyBtns = document.querySelectorAll('.reply-btn');
+    // Reply modal (delegated so rows loaded by infinite scroll work too)
     const replyModal = document.getElementById('replyModal');
 
-    replyBtns.forEach(btn => {
-        btn.addEventListener('click', function() {
-            const email = this.getAttribute('data-email');
-            const name = this.getAttribute('data-name');
+    document.addEventListener('click', function(e) {
+        const btn = e.target.closest('.reply-btn');
+        if (!btn || !replyModal) return;
 
-            document.getElementById('replyTo').value = email;
-            document.getElementById('replySubject').value = `Re: Message from ${name}`;
+        const email = btn.getAttribute('data-email');
+        const name = btn.getAttribute('data-name');
 
-            replyModal.style.display = 'flex';
-        });
+        document.getElementById('replyTo').value = email;
+        document.getElementById('replySubject').value = `Re: Message from ${name}`;
+
+        replyModal.style.display = 'flex';
     });
 
     // Close modal
@@ -9,6 +9,8 @@ const f = {
   form: document.getElementById('downloadForm'),
   url: document.getElementById('url'),
   format: document.getElementById('format'),
+  playlist: document.getElementById('playlist'),
+  stream: document.getElementById('stream'),
   analyzeBtn: document.getElementById('analyzeBtn'),
   analyzeText: document.getElementById('analyzeText'),
   downloadBtn: document.getElementById('downloadBtn'),
@@ -290,6 +292,8 @@ f.format.addEventListener('change', onFormatChange);
 f.url.addEventListener('paste', () => setTimeout(() => f.url.value.trim() && analyze(), 120));
 
 if (socket){
+  // Progress events are only sent to the room of the session we subscribe to
+  socket.on('connect', () => currentId && socket.emit('subscribe', {session_id: currentId}));
   socket.on('progress_update', onProgress);
   socket.on('download_complete', onComplete);
   socket.on('download_error', d => showAlert(`Download failed: ${d.error}`, 'error'));
@@ -337,6 +341,19 @@ function formatDur(s){
   return h?`${h}:${String(m).padStart(2,'0')}:${String(ss).padStart(2,'0')}`:`${m}:${String(ss).padStart(2,'0')}`
 }
 
+function fmtBytes(n){
+  if(!n || n <= 0) return null;
+  const units = ['B','KB','MB','GB','TB'];
+  let i = 0;
+  while(n >= 1024 && i < units.length - 1){ n /= 1024; i++; }
+  return `${n.toFixed(1)} ${units[i]}`;
+}
+
+function fmtEta(s){
+  if(s == null || s < 0) return null;
+  return formatDur(Math.round(s));
+}
+
 function cap(s){
   return String(s||'').replace(/^./, c=>c.toUpperCase());
 }
@@ -413,9 +430,18 @@ function renderInfo(info){
   `;
   if (f.format.value === 'video' && Array.isArray(info.formats) && info.formats.length){
     f.qualityGrid.innerHTML = '';
+    selectedQuality = 'best';
     f.qualityGrid.appendChild(qbtn('best', 'Best Quality', true));
     info.formats.forEach(fr => f.qualityGrid.appendChild(qbtn(fr.quality, `${fr.quality} (${fr.ext})`, false)));
     f.qualityWrap.style.display = 'block';
+  } else if (f.format.value === 'audio'){
+    // Original keeps the source codec (no re-encode); MP3 is converted on the server
+    f.qualityGrid.innerHTML = '';
+    selectedQuality = 'best';
+    f.qualityGrid.appendChild(qbtn('best', 'Original (Opus/M4A)', true));
+    f.qualityGrid.appendChild(qbtn('m4a', 'M4A (AAC)', false));
+    f.qualityGrid.appendChild(qbtn('mp3', 'MP3 (converted)', false));
+    f.qualityWrap.style.display = 'block';
   } else {
     f.qualityWrap.style.display = 'none';
   }
@@ -440,6 +466,9 @@ async function start(){
     format: f.format.value,
     quality: selectedQuality
   };
+  if (f.playlist && f.playlist.checked) requestData.playlist = true;
+  // The server falls back to a staged download when the format can't be piped
+  if (f.stream && f.stream.checked) requestData.stream = true;
   if (settings.cookieSupport && f.cookieSelect.value) {
     requestData.cookie_file = f.cookieSelect.value;
   }
@@ -456,6 +485,9 @@ async function start(){
       f.progress.style.display='block';
       f.downloadBtn.style.display='none';
       resetProgress();
+      if (data.status === 'completed') onComplete(data);
+      else if (socket) socket.emit('subscribe', {session_id: currentId});
+      if (data.stream_url) saveFile(data.stream_url, data.filename);
     } else {
       showAlert(data.error || 'Failed to start download.');
     }
@@ -488,12 +520,17 @@ function resetProgress(){
 function onProgress(d){
   if(d.session_id!==currentId) return;
   f.fill.style.width=`${d.progress}%`;
-  f.s.status.textContent = cap(d.status || '…');
+  f.s.status.textContent = d.status === 'queued' && d.queue_position
+    ? `Queued (#${d.queue_position})`
+    : d.items_total
+      ? `${cap(d.status)} (${d.items_done}/${d.items_total})`
+      : cap(d.status || '…');
   f.s.prog.textContent = `${d.progress}%`;
-  f.s.speed.textContent = d.speed || '—';
-  f.s.eta.textContent = d.eta || '—';
-  f.s.size.textContent = d.file_size || '—';
-  f.s.down.textContent = d.downloaded || '—';
+  const speed = fmtBytes(d.speed);
+  f.s.speed.textContent = speed ? `${speed}/s` : '—';
+  f.s.eta.textContent = fmtEta(d.status === 'queued' ? d.queue_eta : d.eta) || '—';
+  f.s.size.textContent = fmtBytes(d.total_bytes) || '—';
+  f.s.down.textContent = fmtBytes(d.downloaded_bytes) || '—';
   if(d.error){
     showAlert(`Download failed: ${d.error}`);
     resetState();
@@ -505,15 +542,33 @@ function onComplete(d){
   f.s.status.textContent='Completed';
   f.fill.style.width='100%';
   f.s.prog.textContent='100%';
-  const url = `/download_file/${currentId}`;
-  showAlert(`Download ready: <a href="${url}" download="${d.filename}">Click to save</a>`, 'success', 12000);
+  if (d.batch) {
+    // Playlist: one link per finished item
+    const links = d.files.map(x => `<a href="/download_file/${x.session_id}" download="${x.filename}">${x.filename}</a>`);
+    const failed = d.failed ? ` (${d.failed} failed)` : '';
+    const zip = `<a href="/download_zip/${currentId}">Download all as ZIP</a>`;
+    showAlert(`Playlist ready${failed}: ${zip}<br>${links.join('<br>')}`, 'success', 30000);
+  } else if (d.streamed) {
+    // Bytes already went to the browser's download manager
+    showAlert(`Download finished: ${d.filename}`, 'success');
+  } else {
+    // Multi-file posts (carousels, galleries) come as one ZIP
+    const bundle = d.files_count > 1;
+    const url = bundle ? `/download_zip/${currentId}` : `/download_file/${currentId}`;
+    const name = bundle ? '' : d.filename;  // empty: keep the server's .zip name
+    showAlert(`Download ready: <a href="${url}" download="${name}">Click to save</a>`, 'success', 12000);
+    saveFile(url, name);
+  }
+  setTimeout(resetState, 2800);
+}
+
+function saveFile(url, filename){
   const a = document.createElement('a');
   a.href=url;
-  a.download=d.filename;
+  a.download=filename;
   document.body.appendChild(a);
   a.click();
   a.remove();
-  setTimeout(resetState, 2800);
 }
 
 function resetState(){
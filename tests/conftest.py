@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_storage(tmp_path_factory):
+    """Point the database and download directory at a scratch location for the whole run"""
+    root = tmp_path_factory.mktemp("eliot")
+    downloads = root / "downloads"
+    downloads.mkdir()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(main, "DATABASE_PATH", str(root / "eliot_downloader.db"))
+        mp.setattr(main, "DOWNLOAD_DIR", str(downloads))
+        main.init_database()
+        yield root
+
+
+@pytest.fixture
+def download_dir(isolated_storage):
+    return isolated_storage / "downloads"
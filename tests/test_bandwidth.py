@@ -0,0 +1,62 @@
+import pytest
+
+import main
+
+
+def rates(manager, flows):
+    """Register and start each (session, owner, priority) flow, then return the allocated rates"""
+    for session_id, owner, priority in flows:
+        manager.register(session_id, owner, "", priority)
+    for session_id, _, _ in flows:
+        manager.consume(session_id, 1)  # first bytes make the flow active
+    return {sid: flow["rate"] for sid, flow in manager.stats()["flows"].items()}
+
+
+def test_budget_is_split_evenly_between_equal_flows():
+    manager = main.BandwidthManager(budget=900_000)
+    result = rates(manager, [("a", "alice", main.PRIORITY_ANONYMOUS),
+                             ("b", "bob", main.PRIORITY_ANONYMOUS),
+                             ("c", "carol", main.PRIORITY_ANONYMOUS)])
+    assert result == {"a": 300_000, "b": 300_000, "c": 300_000}
+
+
+def test_budget_follows_priority_weights():
+    manager = main.BandwidthManager(budget=1_000_000)
+    result = rates(manager, [("admin", 1, main.PRIORITY_ADMIN), ("anon", "1.2.3.4", main.PRIORITY_ANONYMOUS)])
+    assert result == {"admin": 800_000, "anon": 200_000}
+
+
+def test_owner_cap_hands_the_rest_to_others():
+    manager = main.BandwidthManager(budget=1_000_000, user_cap=500_000)
+    result = rates(manager, [("a1", "alice", main.PRIORITY_ANONYMOUS),
+                             ("a2", "alice", main.PRIORITY_ANONYMOUS),
+                             ("b1", "bob", main.PRIORITY_ANONYMOUS)])
+    # alice's two flows share her cap; bob rises until the budget is used up
+    assert result == {"a1": 250_000, "a2": 250_000, "b1": 500_000}
+
+
+def test_measured_demand_frees_bandwidth():
+    manager = main.BandwidthManager(budget=1_000_000)
+    rates(manager, [("slow", "alice", main.PRIORITY_ANONYMOUS), ("fast", "bob", main.PRIORITY_ANONYMOUS)])
+    with manager._lock:
+        manager._flows["slow"].demand = 100_000
+        manager._rebalance()
+    result = {sid: flow["rate"] for sid, flow in manager.stats()["flows"].items()}
+    assert result == {"slow": 100_000, "fast": 900_000}
+
+
+def test_release_and_reconfigure_rebalance():
+    manager = main.BandwidthManager(budget=600_000)
+    rates(manager, [("a", "alice", main.PRIORITY_ANONYMOUS), ("b", "bob", main.PRIORITY_ANONYMOUS)])
+
+    manager.release("a")
+    assert manager.stats()["flows"]["b"]["rate"] == 600_000
+
+    manager.configure(0, 0)
+    assert manager.stats()["flows"]["b"]["rate"] is None
+
+
+@pytest.mark.parametrize("budget", [0, None])
+def test_unlimited_budget_leaves_flows_unthrottled(budget):
+    manager = main.BandwidthManager(budget=budget)
+    assert rates(manager, [("a", "alice", main.PRIORITY_ANONYMOUS)]) == {"a": None}
@@ -0,0 +1,92 @@
+import io
+import zipfile
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+@pytest.fixture
+def finished(download_dir):
+    """A completed session whose file holds bytes 0..255 repeated"""
+    path = download_dir / "clip-abc.mp4"
+    path.write_bytes(bytes(range(256)) * 40)
+    prog = main.DownloadProgress("finished-session")
+    prog.status = "completed"
+    prog.filepath = str(path)
+    prog.filename = path.name
+    main.download_sessions[prog.session_id] = prog
+    yield prog
+    main.download_sessions.pop(prog.session_id, None)
+
+
+def test_iter_zip_renames_duplicate_names(tmp_path):
+    paths = []
+    for i, folder in enumerate(("one", "two", "three")):
+        (tmp_path / folder).mkdir()
+        path = tmp_path / folder / "song.m4a"
+        path.write_bytes(f"track {i}".encode())
+        paths.append(str(path))
+    other = tmp_path / "one" / "cover.jpg"
+    other.write_bytes(b"jpeg")
+    paths.append(str(other))
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(main.iter_zip(paths))))
+    assert archive.namelist() == ["song.m4a", "song (2).m4a", "song (3).m4a", "cover.jpg"]
+    assert archive.read("song (3).m4a") == b"track 2"
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+    assert archive.testzip() is None
+
+
+def test_full_download_advertises_ranges(client, finished):
+    response = client.get(f"/download_file/{finished.session_id}")
+    assert response.status_code == 200
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+    assert "clip-abc.mp4" in response.headers["Content-Disposition"]
+    assert len(response.data) == 256 * 40
+
+
+def test_range_request_gets_partial_content(client, finished):
+    response = client.get(f"/download_file/{finished.session_id}", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 10-19/{256 * 40}"
+    assert response.data == bytes(range(10, 20))
+
+
+def test_unsatisfiable_range(client, finished):
+    response = client.get(f"/download_file/{finished.session_id}", headers={"Range": "bytes=999999-"})
+    assert response.status_code == 416
+
+
+def test_matching_etag_is_not_modified(client, finished):
+    etag = client.get(f"/download_file/{finished.session_id}").headers["ETag"]
+    response = client.get(f"/download_file/{finished.session_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_if_range_with_stale_etag_sends_whole_file(client, finished):
+    response = client.get(f"/download_file/{finished.session_id}",
+                          headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert len(response.data) == 256 * 40
+
+
+def test_etag_changes_when_file_is_replaced(client, finished):
+    before = client.get(f"/download_file/{finished.session_id}").headers["ETag"]
+    with open(finished.filepath, "wb") as f:
+        f.write(b"new contents")
+    after = client.get(f"/download_file/{finished.session_id}").headers["ETag"]
+    assert before != after
+
+
+def test_unknown_or_unfinished_session(client, finished):
+    assert client.get("/download_file/nope").status_code == 404
+    finished.status = "downloading"
+    assert client.get(f"/download_file/{finished.session_id}").status_code == 400
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+import yt_dlp
+
+import main
+
+
+def info(video_id):
+    return {"id": video_id, "title": f"Video {video_id}", "formats": [{"format_id": "18", "url": "https://x/18"}]}
+
+
+def test_hit_returns_a_private_copy():
+    cache = main.MetadataCache()
+    cache.put("a", info("a"))
+
+    first = cache.get("a")
+    first["title"] = "changed"
+    assert cache.get("a")["title"] == "Video a"
+    assert cache.stats() == {"entries": 1, "hits": 2, "misses": 0}
+
+
+def test_entries_expire_after_ttl():
+    cache = main.MetadataCache(ttl=0.05)
+    cache.put("a", info("a"))
+    assert cache.get("a") is not None
+
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = main.MetadataCache(max_entries=2)
+    cache.put("a", info("a"))
+    cache.put("b", info("b"))
+    cache.get("a")  # "b" is now the oldest
+    cache.put("c", info("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a")["id"] == "a"
+    assert cache.get("c")["id"] == "c"
+
+
+def test_failures_are_cached_briefly():
+    cache = main.MetadataCache(negative_ttl=0.05)
+    cache.put_error("a", "Video unavailable")
+
+    with pytest.raises(yt_dlp.utils.DownloadError, match="Video unavailable"):
+        cache.get("a")
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+
+def test_invalidate_drops_entry():
+    cache = main.MetadataCache()
+    cache.put("a", info("a"))
+    cache.invalidate("a")
+    assert cache.get("a") is None
+
+
+def test_playlist_entries_survive_sanitizing():
+    cache = main.MetadataCache()
+    cache.put("p", {"id": "p", "_type": "playlist", "entries": [info("a"), None, info("b")]})
+    assert [e["id"] for e in cache.get("p")["entries"]] == ["a", "b"]
@@ -0,0 +1,57 @@
+import sqlite3
+
+import main
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+
+
+def test_versions_are_increasing():
+    versions = [version for version, _ in main.SCHEMA_MIGRATIONS]
+    assert versions == sorted(set(versions))
+    assert versions[0] == 1
+
+
+def test_fresh_database_gets_every_migration(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DATABASE_PATH", str(tmp_path / "fresh.db"))
+    main.init_database()
+
+    conn = sqlite3.connect(main.DATABASE_PATH)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == main.SCHEMA_MIGRATIONS[-1][0]
+        names = tables(conn)
+        # v1 and v3 indexes, v2 rollups, v4 job store, v6 cluster tables
+        assert {"idx_user_activities_user_created", "idx_contact_status_created", "traffic_daily",
+                "user_download_stats", "download_jobs", "cluster_commands", "socketio_messages"} <= names
+        # v5, v6 and v7 columns
+        assert {"files", "worker", "batch_id", "items"} <= columns(conn, "download_jobs")
+    finally:
+        conn.close()
+
+
+def test_upgrade_keeps_rows_and_reruns_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DATABASE_PATH", str(tmp_path / "old.db"))
+    monkeypatch.setattr(main, "SCHEMA_MIGRATIONS", main.SCHEMA_MIGRATIONS[:4])
+    main.init_database()
+    conn = sqlite3.connect(main.DATABASE_PATH)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 4
+        assert "files" not in columns(conn, "download_jobs")
+        with conn:
+            conn.execute("INSERT INTO download_jobs (session_id, status, updated_at) VALUES ('s1', 'completed', 1.0)")
+
+        monkeypatch.undo()
+        monkeypatch.setattr(main, "DATABASE_PATH", str(tmp_path / "old.db"))
+        main.apply_migrations(conn)
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == main.SCHEMA_MIGRATIONS[-1][0]
+        assert conn.execute("SELECT status, worker, items FROM download_jobs").fetchall() == [("completed", None, None)]
+
+        # A second run finds nothing to do; re-running ALTER TABLE would raise
+        main.apply_migrations(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,43 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("suffix", [
+    "mp4.part",
+    "mp4.ytdl",
+    "mp4.part-Frag12",
+    "f137.mp4",
+    "f137.mp4.part",
+    "f137.mp4.part-Frag3",
+    "f251.temp.webm",
+    "fhls-720.mp4.part",
+    "temp.mp4",
+])
+def test_intermediate_files_match(suffix):
+    assert main.PARTIAL_FILE_RE.match(suffix)
+
+
+@pytest.mark.parametrize("suffix", [
+    "mp4",
+    "m4a",
+    "opus",
+    "webm",
+    "720.mp4",
+    "mp3.mp3",
+    "info.json",
+    "jpg",
+])
+def test_finished_files_do_not_match(suffix):
+    assert not main.PARTIAL_FILE_RE.match(suffix)
+
+
+def test_remove_partial_files_keeps_finished_output(download_dir):
+    base = download_dir / "clip-abc"
+    for suffix in ("mp4", "mp4.part", "f137.mp4", "f140.m4a.part-Frag1", "info.json"):
+        (download_dir / f"clip-abc.{suffix}").write_bytes(b"x")
+    (download_dir / "clip-abcdef.mp4.part").write_bytes(b"x")  # another download sharing the prefix
+
+    assert main.remove_partial_files(str(base), "s1") == 3
+    assert sorted(p.name for p in download_dir.iterdir() if p.name.startswith("clip-abc")) == [
+        "clip-abc.info.json", "clip-abc.mp4", "clip-abcdef.mp4.part"]
@@ -0,0 +1,67 @@
+import main
+
+
+def job(session_id, owner, priority=main.PRIORITY_ANONYMOUS, host=None):
+    # A host of its own per job unless given, so platform caps stay out of the way
+    url = f"https://{host or session_id + '.example'}/watch"
+    return main.DownloadJob(session_id, url, "video", "best", owner=owner, priority=priority)
+
+
+def drain(scheduler):
+    order = []
+    with scheduler._cond:
+        while (next_job := scheduler._next_runnable()) is not None:
+            order.append(next_job.session_id)
+    return order
+
+
+def test_owners_take_turns_within_a_priority():
+    scheduler = main.DownloadScheduler(workers=0)
+    for sid in ("a1", "a2", "a3"):
+        scheduler.submit(job(sid, "alice"))
+    for sid in ("b1", "b2"):
+        scheduler.submit(job(sid, "bob"))
+
+    assert drain(scheduler) == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_higher_priority_goes_first():
+    scheduler = main.DownloadScheduler(workers=0)
+    scheduler.submit(job("anon", "1.2.3.4"))
+    scheduler.submit(job("user", 7, main.PRIORITY_USER))
+    scheduler.submit(job("admin", 1, main.PRIORITY_ADMIN))
+
+    assert drain(scheduler) == ["admin", "user", "anon"]
+
+
+def test_late_owner_does_not_wait_behind_a_backlog():
+    scheduler = main.DownloadScheduler(workers=0)
+    for i in range(4):
+        scheduler.submit(job(f"a{i}", "alice"))
+    with scheduler._cond:
+        assert scheduler._next_runnable().session_id == "a0"
+        assert scheduler._next_runnable().session_id == "a1"
+    scheduler.submit(job("b0", "bob"))
+
+    assert drain(scheduler) == ["b0", "a2", "a3"]
+
+
+def test_platform_cap_lets_other_platforms_pass():
+    scheduler = main.DownloadScheduler(workers=0)
+    limit = scheduler.platform_limit("busy.example")
+    for i in range(limit + 1):
+        scheduler.submit(job(f"busy{i}", f"owner{i}", host="busy.example"))
+    scheduler.submit(job("other", "someone"))
+
+    assert drain(scheduler) == [f"busy{i}" for i in range(limit)] + ["other"]
+    assert scheduler.stats()["queued"] == 1
+
+
+def test_cancel_removes_queued_job():
+    scheduler = main.DownloadScheduler(workers=0)
+    scheduler.submit(job("a", "alice"))
+    scheduler.submit(job("b", "bob"))
+
+    assert scheduler.cancel("a")
+    assert not scheduler.cancel("a")
+    assert drain(scheduler) == ["b"]